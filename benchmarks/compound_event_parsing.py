@@ -0,0 +1,70 @@
+"""
+Compares single-pass parse_compound_event with the previous
+CompoundMapEvent -> dict() -> typed model parsing, with lazy data validation
+and with trusted construction without validation.
+
+    python -m benchmarks.compound_event_parsing
+"""
+import timeit
+from typing import List
+
+from rf_event_listener.events import CompoundMapEvent, AnyMapEvent, any_event_to_typed, TypedMapEvent
+from rf_event_listener.listener import parse_compound_event
+from rf_event_listener.parser import EventParser
+
+WHO = {'id': 'user-id', 'username': 'user@test'}
+
+EVENT = {
+    'type': 'node_tagged',
+    'what': 'node-id',
+    'who': WHO,
+    'sessionId': 'session-id',
+    'data': {
+        'node': {
+            'id': 'node-id',
+            'title': 'Node title',
+            'map': {'id': 'map-id', 'name': 'Map'},
+            'node_type': {'id': 'type-id', 'name': 'Type', 'icon': None},
+            'parent_title': 'Parent',
+            'color': '#ffffff',
+        },
+        'order': 1,
+        'tag_id': 'tag-id',
+    },
+    'additional': [
+        {'type': 'node_updated', 'what': f'node-{i}', 'sessionId': 'session-id'}
+        for i in range(5)
+    ],
+}
+
+
+def two_pass_parse(json: dict) -> List[TypedMapEvent]:
+    event = CompoundMapEvent(**json)
+    result = [any_event_to_typed(event)]
+    for e in event.additional or []:
+        e = dict(**e)
+        e['who'] = event.who
+        result.append(any_event_to_typed(AnyMapEvent(**e)))
+    return result
+
+
+def main(number: int = 5000):
+    lazy_parser = EventParser(lazy_data=True)
+    trusted_parser = EventParser(trusted=True)
+    assert two_pass_parse(EVENT) == parse_compound_event('map', EVENT)
+    assert two_pass_parse(EVENT) == lazy_parser.parse_compound_event('map', EVENT)
+    assert two_pass_parse(EVENT) == trusted_parser.parse_compound_event('map', EVENT)
+
+    events = number * (1 + len(EVENT['additional']))
+    for name, parse in [
+        ('two-pass', lambda: two_pass_parse(EVENT)),
+        ('single-pass', lambda: parse_compound_event('map', EVENT)),
+        ('lazy data', lambda: lazy_parser.parse_compound_event('map', EVENT)),
+        ('trusted', lambda: trusted_parser.parse_compound_event('map', EVENT)),
+    ]:
+        seconds = min(timeit.repeat(parse, number=number, repeat=3))
+        print(f'{name:>12}: {events / seconds:,.0f} events/sec')
+
+
+if __name__ == '__main__':
+    main()
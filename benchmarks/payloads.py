@@ -0,0 +1,82 @@
+"""
+Synthetic kv entries of map notifications for benchmarks,
+covering all event types, compound events with `additional` and events with heavy typed data.
+"""
+import random
+from typing import List
+
+from rf_event_listener.api import KvEntry
+from rf_event_listener.events import EventType
+
+MAP = {'id': 'map-id', 'name': 'Benchmark map'}
+
+# share of compound events among generated entries
+COMPOUND_SHARE = 0.3
+MAX_ADDITIONAL = 10
+
+
+def node(rnd: random.Random) -> dict:
+    return {
+        'id': f'node-{rnd.randrange(10 ** 6)}',
+        'title': 'Node title ' * rnd.randint(1, 5),
+        'map': MAP,
+        'node_type': {'id': 'type-id', 'name': 'Type', 'icon': None},
+        'parent_title': 'Parent title',
+        'color': '#ffffff',
+    }
+
+
+def event_data(event_type: EventType, rnd: random.Random):
+    if event_type == EventType.node_tagged:
+        return {'node': node(rnd), 'order': rnd.randrange(100), 'tag_id': 'tag-id'}
+    if event_type == EventType.search_query_saved:
+        return {
+            'id': 'query-id',
+            'title': 'Query',
+            'query': 'type:Task AND status:open ' * rnd.randint(1, 5),
+            'timestamp': 1600000000000,
+            'user_id': 'user-id',
+        }
+    if event_type == EventType.command_pushed:
+        nodes = [f'node-{rnd.randrange(10 ** 6)}' for _ in range(rnd.randint(1, 50))]
+        return {
+            'cmd': {
+                'id': 'cmd-id',
+                'type': rnd.choice(['copy', 'cut']),
+                'nodes': nodes,
+                'branch': True,
+                'oneshot': False,
+                'meta': {'map': MAP, 'titles': [f'Title of {n}' for n in nodes]},
+            },
+            'position': rnd.randrange(10),
+        }
+    # data of other events is not typed
+    return {'changes': {'title': 'New title', 'properties': {'global': {'Status': 'open'}}}}
+
+
+def event(event_type: EventType, rnd: random.Random) -> dict:
+    return {
+        'type': event_type.value,
+        'what': f'node-{rnd.randrange(10 ** 6)}',
+        'who': {'id': 'user-id', 'username': 'user@test'},
+        'sessionId': 'session-id',
+        'data': event_data(event_type, rnd),
+    }
+
+
+def generate_entries(count: int, seed: int = 0) -> List[KvEntry]:
+    """ Every event type occurs at least once when count is not less than count of types """
+    rnd = random.Random(seed)
+    types = list(EventType)
+    entries = []
+    timestamp = 1600000000000
+    for i in range(count):
+        value = event(types[i % len(types)], rnd)
+        if rnd.random() < COMPOUND_SHARE:
+            value['additional'] = [
+                {k: v for k, v in event(rnd.choice(types), rnd).items() if k != 'who'}
+                for _ in range(rnd.randint(1, MAX_ADDITIONAL))
+            ]
+        timestamp += rnd.randint(1, 1000)
+        entries.append(KvEntry(key=['mapNotif', str(timestamp)], value=value))
+    return entries
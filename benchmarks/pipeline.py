@@ -0,0 +1,119 @@
+"""
+Throughput and allocations of stages of event processing on synthetic entries, see payloads.py.
+
+    python -m benchmarks.pipeline --output benchmark-results.json
+
+Allocations are measured by a separate pass under tracemalloc: peak is the highest memory use
+during the whole pass, retained is the memory held by its results per event.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import time
+import timeit
+import tracemalloc
+from typing import Callable, List, Any, Dict
+
+import pydantic
+
+from benchmarks.payloads import generate_entries
+from rf_event_listener.events import AnyMapEvent, EventVisitor, any_event_to_typed
+from rf_event_listener.listener import parse_compound_event, process_event
+
+
+async def _consume(timestamp, event):
+    pass
+
+
+def benchmarks(entries: list, loop: asyncio.AbstractEventLoop) -> Dict[str, Callable[[], List[Any]]]:
+    """ Every benchmark processes all entries and returns its results """
+    values = [entry.value for entry in entries]
+    any_events = [AnyMapEvent(**value) for value in values]
+    typed_events = [e for value in values for e in parse_compound_event('map', value)]
+    visitor = EventVisitor(None)
+
+    async def process_events():
+        return [await process_event('map', _consume, entry, False) for entry in entries]
+
+    async def visit_events():
+        return [await event.visit(visitor) for event in typed_events]
+
+    return {
+        'process_event': lambda: loop.run_until_complete(process_events()),
+        'parse_compound_event': lambda: [parse_compound_event('map', value) for value in values],
+        'any_event_to_typed': lambda: [any_event_to_typed(event) for event in any_events],
+        'TypedMapEvent.visit': lambda: loop.run_until_complete(visit_events()),
+    }
+
+
+def event_counts(entries: list) -> Dict[str, int]:
+    entry_events = sum(1 + len(entry.value.get('additional') or []) for entry in entries)
+    return {
+        'process_event': entry_events,
+        'parse_compound_event': entry_events,
+        'any_event_to_typed': len(entries),
+        'TypedMapEvent.visit': entry_events,
+    }
+
+
+def measure_allocations(run: Callable[[], List[Any]]) -> Dict[str, int]:
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        results = run()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del results
+    return {'peak_bytes': peak - before, 'retained_bytes': retained - before}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=2000, help='count of generated kv entries')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this count of runs is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='path of JSON file with results')
+    args = parser.parse_args()
+
+    entries = generate_entries(args.entries, args.seed)
+    counts = event_counts(entries)
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for name, run in benchmarks(entries, loop).items():
+            seconds = min(timeit.repeat(run, number=1, repeat=args.repeat))
+            allocations = measure_allocations(run)
+            events = counts[name]
+            results[name] = {
+                'events': events,
+                'seconds': seconds,
+                'events_per_second': events / seconds,
+                'peak_bytes': allocations['peak_bytes'],
+                'retained_bytes_per_event': allocations['retained_bytes'] / events,
+            }
+            print(
+                f'{name:>22}: {events / seconds:>12,.0f} events/sec, '
+                f'peak {allocations["peak_bytes"]:>12,} B, '
+                f'retained {allocations["retained_bytes"] / events:>8,.0f} B/event'
+            )
+    finally:
+        loop.close()
+
+    if args.output:
+        report = {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'pydantic': pydantic.VERSION,
+            'pydantic_compiled': pydantic.compiled,
+            'entries': args.entries,
+            'seed': args.seed,
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ from datetime import datetime
 from rf_event_listener.api import HttpEventsApi
 from rf_event_listener.events import TypedMapEvent, EventVisitor, CommentPushedMapEvent
 from rf_event_listener.listener import MapsListener, EventConsumer
+from rf_event_listener.offsets import SqliteOffsetStore
 
 
 MAP_ID = os.getenv('MAP_ID')
@@ -27,8 +28,8 @@ class Consumer(EventConsumer):
     async def consume(self, timestamp: datetime, event: TypedMapEvent):
         await event.visit(self._visitor)
 
-    # todo (optional) persist event offset to database
     async def commit(self, offset: str):
+        # the offset is persisted by the offset store afterwards
         print(f'Commit event offset: {offset}')
 
 
@@ -37,10 +38,12 @@ if __name__ == '__main__':
     consumer = Consumer(visitor)
 
     api = HttpEventsApi()
-    listener = MapsListener(api)
+    # offsets of all maps in one file, written at most once a second
+    offset_store = SqliteOffsetStore('offsets.sqlite3', flush_interval_ms=1000)
+    listener = MapsListener(api, offset_store=offset_store)
 
-    # todo (optional) pass initial_offset from database
-    listener.add_map(MAP_ID, USER_PREFIX, consumer, initial_offset=None)
+    # initial_offset is loaded from the offset store
+    listener.add_map(MAP_ID, USER_PREFIX, consumer)
 
     loop = asyncio.get_event_loop()
     loop.run_forever()
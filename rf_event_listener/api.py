@@ -1,14 +1,30 @@
 import aiohttp
 import asyncio
-from aiohttp import ClientSession
-from typing import Optional, List
+import json
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from typing import Optional, List, Callable, Any, AsyncIterator
 from yarl import URL
 
 from rf_event_listener.events import BaseEventModel
+from rf_event_listener.streaming import JsonArraySplitter
 
 
 DEFAULT_RF_URL = URL('https://app.redforester.com')
 
+# extra time to wait for the response of a long-poll after its server-side timeout
+LONG_POLL_TIMEOUT_MARGIN = 5
+
+JsonLoads = Callable[[bytes], Any]
+
+
+def default_json_loads() -> JsonLoads:
+    """ orjson.loads if orjson is installed, json.loads otherwise """
+    try:
+        import orjson
+        return orjson.loads
+    except ImportError:
+        return json.loads
+
 
 class KvNotifyLast(BaseEventModel):
     value: Optional[str]
@@ -20,6 +36,14 @@ class KvEntry(BaseEventModel):
     value: dict
 
 
+class KvPage(list):
+    """ Entries returned by one get_map_notify call, with size of the raw response """
+
+    def __init__(self, entries: List[KvEntry], raw_size: int = 0):
+        super().__init__(entries)
+        self.raw_size = raw_size
+
+
 class EventsApi:
     async def get_map_notify_last(self, map_id: str, kv_prefix: str) -> KvNotifyLast:
         raise NotImplementedError()
@@ -27,46 +51,157 @@ class EventsApi:
     async def get_map_notify(self, map_id: str, kv_prefix: str, offset: Optional[str], limit: int) -> List[KvEntry]:
         raise NotImplementedError()
 
+    async def iter_map_notify(
+            self,
+            map_id: str,
+            kv_prefix: str,
+            offset: Optional[str],
+            limit: int
+    ) -> AsyncIterator[KvEntry]:
+        """ Same entries as get_map_notify, but yielded as soon as they are received """
+        for entry in await self.get_map_notify(map_id, kv_prefix, offset, limit):
+            yield entry
+
     async def wait_for_map_notify_last(self, map_id: str, kv_prefix: str, wait_version: str) -> Optional[KvNotifyLast]:
         raise NotImplementedError()
 
+    async def close_session(self):
+        pass
+
+
+class ConnectionPoolConfig:
+    def __init__(
+            self,
+            limit: int = 100,
+            limit_per_host: int = 0,
+            keepalive_timeout: float = 15,
+            ttl_dns_cache: Optional[int] = 10,
+    ):
+        """
+        :param limit: total count of simultaneous connections, 0 means no limit
+        :param limit_per_host: count of simultaneous connections to one host, 0 means no limit
+        :param keepalive_timeout: how long an idle connection is kept open
+        :param ttl_dns_cache: how long resolved addresses are cached, None caches forever
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+
+    @classmethod
+    def for_maps(
+            cls,
+            map_count: int,
+            max_concurrent_waits: Optional[int] = None,
+            extra_connections: int = 10,
+            **kwargs
+    ) -> 'ConnectionPoolConfig':
+        """
+        Pool for listening to `map_count` maps. Every map listener holds at most one request at a time,
+        so the pool is sized for all long-polls, limited by LongPollScheduler if it is used,
+        plus `extra_connections` for reading events meanwhile.
+        """
+        long_polls = map_count if max_concurrent_waits is None else min(map_count, max_concurrent_waits)
+        return cls(limit=long_polls + extra_connections, **kwargs)
+
+    def create_connector(self) -> TCPConnector:
+        return TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+        )
+
+
+def create_session(read_timeout: float = 60, pool: Optional[ConnectionPoolConfig] = None) -> ClientSession:
+    """ Session, which can be shared by several HttpEventsApi instances """
+    pool = pool or ConnectionPoolConfig()
+    return ClientSession(
+        connector=pool.create_connector(),
+        timeout=ClientTimeout(total=None, sock_read=read_timeout + LONG_POLL_TIMEOUT_MARGIN),
+        raise_for_status=True,
+    )
+
 
 class HttpEventsApi(EventsApi):
-    def __init__(self, base_url: URL = DEFAULT_RF_URL, read_timeout: float = 60):
+    def __init__(
+            self,
+            base_url: URL = DEFAULT_RF_URL,
+            read_timeout: float = 60,
+            pool: Optional[ConnectionPoolConfig] = None,
+            session: Optional[ClientSession] = None,
+            json_loads: Optional[JsonLoads] = None,
+    ):
+        """
+        :param read_timeout: server-side timeout of long-polls
+        :param pool: connection pool of the created session
+        :param session: shared session, it is not closed with this instance, `pool` is ignored
+        :param json_loads: decoder of raw response body, see default_json_loads
+        """
         self._base_url = base_url
         self._read_timeout = read_timeout
-        self._session = ClientSession(
-            read_timeout=60,
-            raise_for_status=True
-        )
+        self._timeout = ClientTimeout(total=None, sock_read=read_timeout + LONG_POLL_TIMEOUT_MARGIN)
+        self._own_session = session is None
+        self._session = session or create_session(read_timeout, pool)
+        self._json_loads = json_loads or default_json_loads()
 
     async def __aenter__(self) -> 'HttpEventsApi':
-        await self._session.__aenter__()
+        if self._own_session:
+            await self._session.__aenter__()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self._session.__aexit__(exc_type, exc_val, exc_tb)
+        if self._own_session:
+            await self._session.__aexit__(exc_type, exc_val, exc_tb)
 
     async def close_session(self):
         """ Only if you using HttpEventsApi instance without context manager """
-        await self._session.close()
+        if self._own_session:
+            await self._session.close()
+
+    async def _get_raw(self, url: URL) -> bytes:
+        async with self._session.get(url, timeout=self._timeout) as resp:
+            # shared session may be created without raise_for_status
+            resp.raise_for_status()
+            return await resp.read()
+
+    async def _get_json(self, url: URL):
+        # decode bytes as is, without decoding them to str first
+        return self._json_loads(await self._get_raw(url))
 
     async def get_map_notify_last(self, map_id: str, kv_prefix: str) -> KvNotifyLast:
         url = self._base_url / f"kv/keys/mapNotifLast:{map_id}:{kv_prefix}"
-        async with self._session.get(url) as resp:
-            body = await resp.json()
-            return KvNotifyLast(**body)
+        body = await self._get_json(url)
+        return KvNotifyLast(**body)
 
     async def get_map_notify(self, map_id: str, kv_prefix: str, offset: Optional[str], limit: int) -> List[KvEntry]:
+        url = self._map_notify_url(map_id, kv_prefix, offset, limit)
+        raw = await self._get_raw(url)
+        return KvPage([KvEntry(**e) for e in self._json_loads(raw)], len(raw))
+
+    async def iter_map_notify(
+            self,
+            map_id: str,
+            kv_prefix: str,
+            offset: Optional[str],
+            limit: int
+    ) -> AsyncIterator[KvEntry]:
+        """ Parses entries incrementally while the response is being received """
+        url = self._map_notify_url(map_id, kv_prefix, offset, limit)
+        async with self._session.get(url, timeout=self._timeout) as resp:
+            resp.raise_for_status()
+            splitter = JsonArraySplitter()
+            async for chunk in resp.content.iter_any():
+                for item in splitter.feed(chunk):
+                    yield KvEntry(**self._json_loads(item))
+            splitter.close()
+
+    def _map_notify_url(self, map_id: str, kv_prefix: str, offset: Optional[str], limit: int) -> URL:
         url = self._base_url / f"kv/partition/mapNotif:{map_id}:{kv_prefix}"
         query = {'limit': limit}
         if offset is not None:
             query['from'] = offset
-        url = url.with_query(query)
-
-        async with self._session.get(url) as resp:
-            body = list(await resp.json())
-            return [KvEntry(**e) for e in body]
+        return url.with_query(query)
 
     async def wait_for_map_notify_last(self, map_id: str, kv_prefix: str, wait_version: str) -> Optional[KvNotifyLast]:
         try:
@@ -75,9 +210,8 @@ class HttpEventsApi(EventsApi):
                 'waitVersion': wait_version,
                 'waitTimeout': self._read_timeout,
             })
-            async with self._session.get(url) as resp:
-                body = await resp.json()
-                return KvNotifyLast(**body)
+            body = await self._get_json(url)
+            return KvNotifyLast(**body)
         except asyncio.TimeoutError:
             return None
         except aiohttp.ClientResponseError as e:
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from asyncio import Future
+from collections import deque
+from typing import Optional, Deque, Tuple, Any
+
+
+class BufferLimits:
+    def __init__(
+            self,
+            high_events: int = 1000,
+            low_events: Optional[int] = None,
+            high_bytes: Optional[int] = None,
+            low_bytes: Optional[int] = None,
+    ):
+        """
+        Fetching of a map pauses when its buffer reaches any high watermark,
+        and resumes when the buffer drops below all low watermarks.
+
+        :param low_events: half of high_events by default
+        :param high_bytes: limit of raw response size of buffered pages, not limited by default;
+            the size is known only for pages returned by HttpEventsApi.get_map_notify
+        :param low_bytes: half of high_bytes by default
+        """
+        self.high_events = high_events
+        self.low_events = low_events if low_events is not None else high_events // 2
+        self.high_bytes = high_bytes
+        self.low_bytes = low_bytes if low_bytes is not None or high_bytes is None else high_bytes // 2
+
+
+class PageBuffer:
+    """
+    Queue of fetched pages of one map between its fetch and consume stages.
+    A page is always accepted by an empty buffer, so memory is bounded by the high watermark plus one page.
+    """
+
+    def __init__(self, limits: Optional[BufferLimits] = None, max_pages: int = 0):
+        """
+        :param max_pages: count of buffered pages, 0 means no limit
+        """
+        self._limits = limits
+        self._max_pages = max_pages
+        self._items: Deque[Tuple[Any, int, int]] = deque()
+        self._events = 0
+        self._bytes = 0
+        self._paused = False
+        self._changed: Optional[Future] = None
+
+        self._blocked_since: Optional[float] = None
+        self._blocked_count = 0
+        self._blocked_seconds = 0.0
+
+    async def put(self, page: Any, events: int, size: int = 0):
+        """ Waits while the buffer is full """
+        if self._is_full():
+            self._blocked_count += 1
+            self._blocked_since = time.monotonic()
+            try:
+                while self._is_full():
+                    await asyncio.wait([self._changed_future()])
+            finally:
+                self._blocked_seconds += time.monotonic() - self._blocked_since
+                self._blocked_since = None
+
+        self._items.append((page, events, size))
+        self._events += events
+        self._bytes += size
+        if self._limits is not None and self._reached_high():
+            self._paused = True
+        self._notify()
+
+    async def get(self) -> Any:
+        while len(self._items) == 0:
+            await asyncio.wait([self._changed_future()])
+
+        page, events, size = self._items.popleft()
+        self._events -= events
+        self._bytes -= size
+        if self._paused and self._below_low():
+            self._paused = False
+        self._notify()
+        return page
+
+    def stats(self) -> dict:
+        blocked_seconds = self._blocked_seconds
+        if self._blocked_since is not None:
+            blocked_seconds += time.monotonic() - self._blocked_since
+        return {
+            'pages': len(self._items),
+            'events': self._events,
+            'bytes': self._bytes,
+            'fetch_paused': self._blocked_since is not None,
+            'blocked_count': self._blocked_count,
+            'blocked_seconds': blocked_seconds,
+        }
+
+    def _is_full(self) -> bool:
+        if len(self._items) == 0:
+            return False
+        return self._paused or (self._max_pages > 0 and len(self._items) >= self._max_pages)
+
+    def _reached_high(self) -> bool:
+        limits = self._limits
+        if self._events >= limits.high_events:
+            return True
+        return limits.high_bytes is not None and self._bytes >= limits.high_bytes
+
+    def _below_low(self) -> bool:
+        limits = self._limits
+        return self._events <= limits.low_events and (limits.low_bytes is None or self._bytes <= limits.low_bytes)
+
+    def _changed_future(self) -> Future:
+        if self._changed is None:
+            self._changed = asyncio.get_event_loop().create_future()
+        return self._changed
+
+    def _notify(self):
+        if self._changed is not None:
+            self._changed.set_result(None)
+            self._changed = None
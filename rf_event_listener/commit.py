@@ -0,0 +1,36 @@
+class CommitPolicy:
+    """ Decides when the offset of consumed events is passed to EventConsumer.commit """
+
+    def should_commit(self, pending_events: int, since_last_commit_ms: float, page_end: bool) -> bool:
+        """
+        :param pending_events: count of consumed events with not yet committed offset
+        :param since_last_commit_ms: time passed since the previous commit
+        :param page_end: whether the last page of events is fully consumed
+        """
+        raise NotImplementedError()
+
+
+class CommitEachEvent(CommitPolicy):
+    def should_commit(self, pending_events: int, since_last_commit_ms: float, page_end: bool) -> bool:
+        return True
+
+
+class CommitEachPage(CommitPolicy):
+    def should_commit(self, pending_events: int, since_last_commit_ms: float, page_end: bool) -> bool:
+        return page_end
+
+
+class CommitEveryEvents(CommitPolicy):
+    def __init__(self, count: int):
+        self._count = count
+
+    def should_commit(self, pending_events: int, since_last_commit_ms: float, page_end: bool) -> bool:
+        return pending_events >= self._count
+
+
+class CommitEveryInterval(CommitPolicy):
+    def __init__(self, interval_ms: float):
+        self._interval_ms = interval_ms
+
+    def should_commit(self, pending_events: int, since_last_commit_ms: float, page_end: bool) -> bool:
+        return since_last_commit_ms >= self._interval_ms
@@ -0,0 +1,33 @@
+from collections import deque
+from typing import Iterable, List, Deque, Set
+
+
+class RecentOffsets:
+    """
+    Offsets of the last `window` processed entries of one map, so redelivered entries are dropped.
+    It is exact within the window, unlike a bloom filter, which could drop new events.
+    """
+
+    def __init__(self, window: int = 10000, offsets: Iterable[str] = ()):
+        self._ring: Deque[str] = deque(maxlen=window)
+        self._set: Set[str] = set()
+        for offset in offsets:
+            self.add(offset)
+
+    def __contains__(self, offset: str) -> bool:
+        return offset in self._set
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+    def add(self, offset: str):
+        if offset in self._set:
+            return
+        if len(self._ring) == self._ring.maxlen:
+            self._set.discard(self._ring[0])
+        self._ring.append(offset)
+        self._set.add(offset)
+
+    def offsets(self) -> List[str]:
+        """ From the oldest to the newest """
+        return list(self._ring)
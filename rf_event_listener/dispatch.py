@@ -0,0 +1,70 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import Callable, List, Tuple, Hashable, Coroutine, Any, Deque, Dict
+
+from rf_event_listener.parser import ParsedEntry
+
+
+def node_key(events: ParsedEntry) -> Hashable:
+    """ Entries about the same node are consumed in order """
+    return events[0][1].what if len(events) != 0 else None
+
+
+class ConcurrentDispatcher:
+    """
+    Consumes entries of a page by a bounded pool of workers.
+    Entries with the same key are consumed one by one in their order, other entries concurrently.
+    """
+
+    def __init__(self, workers: int = 8, key: Callable[[ParsedEntry], Hashable] = node_key):
+        self._workers = workers
+        self._key = key
+
+    async def dispatch(
+            self,
+            entries: List[Tuple[str, ParsedEntry]],
+            consume: Callable[[str, ParsedEntry], Coroutine[Any, Any, None]],
+            progress: Callable[[str, int, bool], Coroutine[Any, Any, None]],
+    ):
+        """
+        :param entries: offsets with parsed events of entries
+        :param consume: consumes offset and events of one entry
+        :param progress: called with the highest offset, before which all entries are consumed,
+            count of newly consumed entries and whether the page is complete
+        """
+        lanes: Dict[Hashable, Deque[int]] = OrderedDict()
+        for i, (_, events) in enumerate(entries):
+            lanes.setdefault(self._key(events), deque()).append(i)
+
+        ready = deque(lanes.values())
+        completed = [False] * len(entries)
+        watermark = 0
+        reported = 0
+        lock = asyncio.Lock()
+
+        async def report():
+            nonlocal reported
+            # reports are serialized, so offsets are passed in ascending order
+            async with lock:
+                if watermark > reported:
+                    count = watermark - reported
+                    reported = watermark
+                    await progress(entries[watermark - 1][0], count, watermark == len(entries))
+
+        async def work():
+            nonlocal watermark
+            while len(ready) != 0:
+                lane = ready.popleft()
+                for i in lane:
+                    await consume(*entries[i])
+                    completed[i] = True
+                    while watermark < len(entries) and completed[watermark]:
+                        watermark += 1
+                    await report()
+
+        workers = [asyncio.ensure_future(work()) for _ in range(min(self._workers, len(lanes)))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
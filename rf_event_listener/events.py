@@ -1,7 +1,8 @@
 from enum import Enum
-from typing import Optional, Any, List, TypeVar, Generic
+from typing import Optional, Any, List, TypeVar, Generic, Callable, Dict, Type, Set
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError, validate_model
+from pydantic.fields import ModelField, SHAPE_SINGLETON, SHAPE_LIST
 
 T = TypeVar('T')
 
@@ -213,6 +214,14 @@ class EventVisitor(Generic[T]):
         return self._default_result
 
 
+def visited_event_types(visitor: EventVisitor) -> Set[EventType]:
+    """ Event types, which methods are overridden by the visitor, to filter other events out on parsing """
+    return {
+        event_type for event_type in EventType
+        if getattr(type(visitor), event_type.value) is not getattr(EventVisitor, event_type.value)
+    }
+
+
 class BaseMapEvent(BaseEventModel):
     type: EventType
     what: str
@@ -228,6 +237,15 @@ class TypedMapEvent(AnyMapEvent):
     async def visit(self, visitor: EventVisitor[T]) -> T:
         raise NotImplementedError()
 
+    def _iter(self, *args, **kwargs):
+        # validates lazy data before export and comparison
+        getattr(self, 'data')
+        return super()._iter(*args, **kwargs)
+
+    def __repr_args__(self):
+        getattr(self, 'data')
+        return super().__repr_args__()
+
 
 class NodeUpdatedMapEvent(TypedMapEvent):
     async def visit(self, visitor: EventVisitor[T]) -> T:
@@ -394,6 +412,44 @@ class CompoundMapEvent(AnyMapEvent):
     additional: Optional[List[dict]] = None
 
 
+class RawEventData:
+    """ Not yet validated `data` of a lazily parsed event """
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+class LazyEventData:
+    """ Descriptor of the `data` field, validates RawEventData on first access and caches the result """
+
+    def __get__(self, instance: Optional[TypedMapEvent], owner: type):
+        if instance is None:
+            return self
+        value = instance.__dict__['data']
+        if value.__class__ is RawEventData:
+            field = owner.__fields__['data']
+            value, errors = field.validate(value.value, {}, loc='data', cls=owner)
+            if errors:
+                raise ValidationError([errors], owner)
+            instance.__dict__['data'] = value
+        return value
+
+    def __set__(self, instance: TypedMapEvent, value: Any):
+        instance.__dict__['data'] = value
+
+
+# events with typed data model, which may be validated lazily
+lazy_data_events = (
+    NodeTaggedMapEvent,
+    SearchQuerySavedMapEvent,
+    CommandPushedMapEvent,
+)
+
+for _event_class in lazy_data_events:
+    _event_class.data = LazyEventData()
+
+
 event_type_to_typed_event = {
     EventType.node_updated: NodeUpdatedMapEvent,
     EventType.node_type_updated: NodeTypeUpdatedMapEvent,
@@ -432,3 +488,102 @@ event_type_to_typed_event = {
 def any_event_to_typed(event: AnyMapEvent) -> TypedMapEvent:
     typed_event = event_type_to_typed_event[event.type]
     return typed_event(**event.dict())
+
+
+def parse_typed_event(json: dict, lazy_data: bool = False) -> TypedMapEvent:
+    """
+    Validates raw event json straight into the TypedMapEvent subclass of its type
+
+    :param lazy_data: validate only the envelope now, typed `data` is validated on first access
+    """
+    try:
+        event_type = EventType(json.get('type'))
+    except ValueError:
+        # unknown or missing type, AnyMapEvent raises the same ValidationError as the two-pass parsing
+        AnyMapEvent(**json)
+        raise
+
+    event_class = event_type_to_typed_event[event_type]
+    if lazy_data and event_class in lazy_data_events and 'data' in json:
+        return _parse_lazy_data_event(event_class, json)
+    return event_class(**json)
+
+
+def _parse_lazy_data_event(event_class: type, json: dict) -> TypedMapEvent:
+    values, fields_set, errors = validate_model(BaseMapEvent, json)
+    if errors:
+        raise errors
+    values['data'] = RawEventData(json['data'])
+    fields_set.add('data')
+    return event_class.construct(_fields_set=fields_set, **values)
+
+
+def construct_typed_event(json: dict) -> TypedMapEvent:
+    """
+    Builds typed event from trusted json without validation, nested models and enums are still created.
+    Falls back to parse_typed_event if the json does not match the models
+    """
+    try:
+        event_class = event_type_to_typed_event[EventType(json['type'])]
+        return _model_constructor(event_class)(json)
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return parse_typed_event(json)
+
+
+_constructors: Dict[type, Callable[[Any], BaseModel]] = {}
+
+
+def _model_constructor(model: Type[BaseModel]) -> Callable[[Any], BaseModel]:
+    constructor = _constructors.get(model)
+    if constructor is not None:
+        return constructor
+
+    fields = [
+        (name, field.alias, field.required, field.default, _value_constructor(field))
+        for name, field in model.__fields__.items()
+    ]
+
+    def construct(values: Any) -> BaseModel:
+        if isinstance(values, model):
+            return values
+
+        fields_values = {}
+        fields_set = set()
+        for name, alias, required, default, convert in fields:
+            if alias in values:
+                value = values[alias]
+            elif name in values:
+                value = values[name]
+            elif required:
+                raise KeyError(name)
+            else:
+                fields_values[name] = default
+                continue
+            fields_values[name] = value if convert is None or value is None else convert(value)
+            fields_set.add(name)
+
+        instance = model.__new__(model)
+        object.__setattr__(instance, '__dict__', fields_values)
+        object.__setattr__(instance, '__fields_set__', fields_set)
+        return instance
+
+    _constructors[model] = construct
+    return construct
+
+
+def _value_constructor(field: ModelField) -> Optional[Callable[[Any], Any]]:
+    if not isinstance(field.type_, type):
+        return None
+
+    if issubclass(field.type_, BaseModel):
+        convert = _model_constructor(field.type_)
+    elif issubclass(field.type_, Enum):
+        convert = field.type_
+    else:
+        return None
+
+    if field.shape == SHAPE_SINGLETON:
+        return convert
+    if field.shape == SHAPE_LIST:
+        return lambda values: [convert(v) for v in values]
+    return None
@@ -1,13 +1,26 @@
 import asyncio
 import logging
+import time
 from asyncio import Task, CancelledError, AbstractEventLoop
+from concurrent.futures import Executor
 from datetime import datetime
-from typing import Dict, Optional, Callable, Coroutine, Any, List
+from typing import Dict, Optional, Callable, Coroutine, Any, List, AsyncIterator, Tuple, Sequence, \
+    AbstractSet, Iterable, NamedTuple
 
-from pydantic import ValidationError
-
-from rf_event_listener.api import EventsApi, KvEntry
-from rf_event_listener.events import TypedMapEvent, CompoundMapEvent, any_event_to_typed, AnyMapEvent
+from rf_event_listener.api import EventsApi, KvEntry, KvNotifyLast
+from rf_event_listener.buffer import BufferLimits, PageBuffer
+from rf_event_listener.commit import CommitPolicy, CommitEachEvent
+from rf_event_listener.dedupe import RecentOffsets
+from rf_event_listener.dispatch import ConcurrentDispatcher
+from rf_event_listener.events import TypedMapEvent, EventType
+from rf_event_listener.metrics import MetricsRegistry, MapMetrics
+from rf_event_listener.offsets import OffsetStore
+from rf_event_listener.paging import PageSizer
+from rf_event_listener.parser import EventParser, ParsedEntry
+from rf_event_listener.retry import ExponentialBackoff, CircuitBreaker, breaker_guard
+from rf_event_listener.scheduler import LongPollScheduler
+from rf_event_listener.startup import StartupScheduler
+from rf_event_listener.tracing import TraceHook, Tracer, TraceStage
 
 logger = logging.getLogger('rf_maps_listener')
 
@@ -19,6 +32,10 @@ class EventConsumer:
     async def consume(self, timestamp: datetime, event: TypedMapEvent):
         raise NotImplementedError()
 
+    async def consume_batch(self, events: List[Tuple[datetime, TypedMapEvent]]):
+        """ Optional, if implemented it is called once per page instead of consume """
+        raise NotImplementedError()
+
     async def commit(self, offset: str):
         pass
 
@@ -33,22 +50,120 @@ class MapsListener:
             events_per_request: int = 100,
             loop: Optional[AbstractEventLoop] = None,
             skip_unknown_events: bool = False,
+            prefetch_pages: int = 0,
+            commit_policy: Optional[CommitPolicy] = None,
+            lazy_event_data: bool = False,
+            trusted_events: bool = False,
+            validation_sample_rate: float = 0.0,
+            long_poll_scheduler: Optional[LongPollScheduler] = None,
+            stream_pages: bool = False,
+            page_sizer_factory: Optional[Callable[[], PageSizer]] = None,
+            backoff: Optional[ExponentialBackoff] = None,
+            circuit_breaker: Optional[CircuitBreaker] = None,
+            dispatcher: Optional[ConcurrentDispatcher] = None,
+            parse_executor: Optional[Executor] = None,
+            parse_offload_threshold: int = 50,
+            buffer_limits: Optional[BufferLimits] = None,
+            metrics: Optional[MetricsRegistry] = None,
+            trace_hooks: Sequence[TraceHook] = (),
+            event_types: Optional[AbstractSet[EventType]] = None,
+            offset_store: Optional[OffsetStore] = None,
+            startup_scheduler: Optional[StartupScheduler] = None,
+            persist_notify_version: bool = False,
+            dedupe_window: int = 0,
+            persist_dedupe: bool = False,
     ):
+        """
+        :param prefetch_pages: how many pages may be fetched ahead while the current page is consumed,
+            0 disables prefetching
+        :param commit_policy: when to call EventConsumer.commit, after each event by default
+        :param lazy_event_data: validate typed `data` of events on first access instead of on parsing
+        :param trusted_events: build events without validation, the backend is trusted to send valid events
+        :param validation_sample_rate: fraction of events validated anyway with trusted_events,
+            so schema drift is detected
+        :param long_poll_scheduler: limits count of concurrent long-polls for new events
+        :param stream_pages: consume events as soon as they are received, see EventsApi.iter_map_notify,
+            batch consumer receives them one by one then
+        :param page_sizer_factory: creates page sizer of every map, e.g. AdaptivePageSizer,
+            constant events_per_request by default
+        :param backoff: delays of retries after errors in the events loop of a map
+        :param circuit_breaker: shared by all maps, stops requests of all maps while the API is failing,
+            not used by default
+        :param dispatcher: consume events of a page concurrently, offsets are committed up to
+            the highest offset, before which all events are consumed; not used with batch consumers
+        :param parse_executor: process or thread pool, which parses pages
+            with at least parse_offload_threshold events, smaller pages are parsed in the event loop
+        :param buffer_limits: fetch pages of every map in background into a buffer with these watermarks,
+            fetching pauses while the consumer is behind; can be combined with prefetch_pages
+        :param metrics: records throughput, latencies and lag of every map
+        :param trace_hooks: called around stages of every map, see also add_trace_hook
+        :param event_types: consume only events of these types, other events are skipped without parsing,
+            but their offsets are committed; see also visited_event_types
+        :param offset_store: persists offsets after EventConsumer.commit,
+            maps added without initial_offset start from the offset in the store
+        :param startup_scheduler: ramps up starting maps, e.g. after restart of the process
+        :param persist_notify_version: store last notify versions in offset_store, so maps with offsets
+            start without get_map_notify_last request
+        :param dedupe_window: entries with offsets among this many last processed offsets of the map
+            are dropped before parsing, e.g. redelivered after a restart from an older offset; 0 disables
+        :param persist_dedupe: store offsets of entries processed after the committed offset in offset_store,
+            so entries consumed, but not committed before restart of the process, are dropped too
+        """
         self._api = api
         self._listeners: Dict[str, Task] = {}
+        self._map_listeners: Dict[str, MapListener] = {}
         self._events_per_request = events_per_request
         self._loop = loop or asyncio.get_event_loop()
         self._skip_unknown_events = skip_unknown_events
+        self._prefetch_pages = prefetch_pages
+        self._commit_policy = commit_policy or CommitEachEvent()
+        self._lazy_event_data = lazy_event_data
+        self._trusted_events = trusted_events
+        self._validation_sample_rate = validation_sample_rate
+        self._long_poll_scheduler = long_poll_scheduler
+        self._stream_pages = stream_pages
+        self._page_sizer_factory = page_sizer_factory
+        self._backoff = backoff or ExponentialBackoff()
+        self._circuit_breaker = circuit_breaker
+        self._dispatcher = dispatcher
+        self._parse_executor = parse_executor
+        self._parse_offload_threshold = parse_offload_threshold
+        self._buffer_limits = buffer_limits
+        self._metrics = metrics
+        self._tracer = Tracer(trace_hooks)
+        self._event_types = event_types
+        self._offset_store = offset_store
+        self._startup_scheduler = startup_scheduler
+        self._persist_notify_version = persist_notify_version and offset_store is not None
+        self._dedupe_window = dedupe_window
+        self._persist_dedupe = persist_dedupe and offset_store is not None and dedupe_window > 0
+
+    @property
+    def api(self) -> EventsApi:
+        return self._api
+
+    def add_trace_hook(self, hook: TraceHook):
+        """ Hooks are applied to already added maps too """
+        self._tracer.add_hook(hook)
+
+    def remove_trace_hook(self, hook: TraceHook):
+        self._tracer.remove_hook(hook)
 
     def add_map(
             self,
             map_id: str,
             kv_prefix: str,
             consumer: EventConsumer,
-            initial_offset: Optional[str] = None
+            initial_offset: Optional[str] = None,
+            event_types: Optional[AbstractSet[EventType]] = None,
     ):
+        """
+        :param event_types: overrides event_types of MapsListener for this map
+        """
         if map_id in self._listeners:
             return
+        if initial_offset is None and self._offset_store is not None:
+            initial_offset = self._offset_store.load(map_id)
         listener = MapListener(
             self._api,
             consumer,
@@ -57,16 +172,150 @@ class MapsListener:
             kv_prefix,
             initial_offset,
             self._skip_unknown_events,
+            prefetch_pages=self._prefetch_pages,
+            commit_policy=self._commit_policy,
+            lazy_event_data=self._lazy_event_data,
+            trusted_events=self._trusted_events,
+            validation_sample_rate=self._validation_sample_rate,
+            long_poll_scheduler=self._long_poll_scheduler,
+            stream_pages=self._stream_pages,
+            page_sizer=self._page_sizer_factory() if self._page_sizer_factory is not None else None,
+            backoff=self._backoff,
+            circuit_breaker=self._circuit_breaker,
+            dispatcher=self._dispatcher,
+            parse_executor=self._parse_executor,
+            parse_offload_threshold=self._parse_offload_threshold,
+            buffer_limits=self._buffer_limits,
+            metrics=self._metrics.map(map_id) if self._metrics is not None else None,
+            tracer=self._tracer,
+            event_types=event_types if event_types is not None else self._event_types,
+            offset_store=self._offset_store,
+            startup_scheduler=self._startup_scheduler,
+            persist_notify_version=self._persist_notify_version,
+            dedupe_window=self._dedupe_window,
+            persist_dedupe=self._persist_dedupe,
         )
         task = self._loop.create_task(listener.listen())
         self._listeners[map_id] = task
+        self._map_listeners[map_id] = listener
 
-    def remove_map(self, map_id: str):
+    def remove_map(self, map_id: str) -> Optional[Task]:
+        """ Returns the cancelled task of the map listener, it completes when the last offset is committed """
         task = self._listeners.get(map_id, None)
         if task is None:
-            return
+            return None
         task.cancel()
         del self._listeners[map_id]
+        del self._map_listeners[map_id]
+        if self._metrics is not None:
+            self._metrics.remove_map(map_id)
+        return task
+
+    async def set_maps(
+            self,
+            desired: Iterable['MapSpec'],
+            close_concurrency: int = 100,
+            add_batch_size: int = 500,
+    ) -> 'SetMapsReport':
+        """
+        Adds missing maps and removes maps, which are not desired, waiting until their last offsets
+        are committed and consumers are closed. Maps with changed kv prefix are restarted.
+        Should not be called concurrently.
+
+        :param close_concurrency: count of removed maps, which are closed at once
+        :param add_batch_size: the event loop is released after every batch of added maps
+        """
+        desired = {spec.map_id: spec for spec in desired}
+        restarted = [
+            map_id for map_id, spec in desired.items()
+            if map_id in self._map_listeners and self._map_listeners[map_id].kv_prefix != spec.kv_prefix
+        ]
+        removed = [map_id for map_id in self._listeners if map_id not in desired]
+        failed = await self._stop_maps([*removed, *restarted], close_concurrency)
+
+        added = []
+        for map_id, spec in desired.items():
+            if map_id in self._listeners:
+                continue
+            self.add_map(map_id, spec.kv_prefix, spec.consumer, spec.initial_offset, spec.event_types)
+            added.append(map_id)
+            if len(added) % add_batch_size == 0:
+                await asyncio.sleep(0)
+
+        restarted_set = set(restarted)
+        return SetMapsReport(
+            added=[map_id for map_id in added if map_id not in restarted_set],
+            removed=removed,
+            restarted=restarted,
+            failed=failed,
+            unchanged=len(desired) - len(added),
+        )
+
+    async def _stop_maps(self, map_ids: List[str], concurrency: int) -> List[str]:
+        """ Returns maps, which failed to commit or close """
+        semaphore = asyncio.Semaphore(concurrency)
+        failed = []
+
+        async def stop(map_id: str):
+            async with semaphore:
+                task = self.remove_map(map_id)
+                try:
+                    await task
+                except CancelledError:
+                    pass
+                except Exception:
+                    logger.exception(f"[{map_id}] Error in stopping of map listener")
+                    failed.append(map_id)
+
+        await asyncio.gather(*[stop(map_id) for map_id in map_ids])
+        return failed
+
+    async def committed_offset(self, map_id: str) -> Optional[str]:
+        """ Offset of the map in the storage of offset_store, see OffsetStore.load_committed """
+        return await self._offset_store.load_committed(map_id) if self._offset_store is not None else None
+
+    async def flush_offsets(self):
+        """ Writes offsets committed by maps to the storage of offset_store """
+        if self._offset_store is not None:
+            await self._offset_store.flush()
+
+    def page_size(self, map_id: str) -> Optional[int]:
+        """ Current count of events requested at once for the map """
+        listener = self._map_listeners.get(map_id, None)
+        return listener.page_size if listener is not None else None
+
+    def buffer_stats(self, map_id: str) -> Optional[dict]:
+        """ Depth of the page buffer of the map and time its fetching was blocked, see PageBuffer.stats """
+        listener = self._map_listeners.get(map_id, None)
+        return listener.buffer_stats() if listener is not None else None
+
+
+class MapSpec:
+    """ Desired map of MapsListener.set_maps, arguments of add_map """
+
+    def __init__(
+            self,
+            map_id: str,
+            kv_prefix: str,
+            consumer: EventConsumer,
+            initial_offset: Optional[str] = None,
+            event_types: Optional[AbstractSet[EventType]] = None,
+    ):
+        self.map_id = map_id
+        self.kv_prefix = kv_prefix
+        self.consumer = consumer
+        self.initial_offset = initial_offset
+        self.event_types = event_types
+
+
+class SetMapsReport(NamedTuple):
+    added: List[str]
+    removed: List[str]
+    # maps with changed kv prefix
+    restarted: List[str]
+    # removed or restarted maps, which failed to commit or close
+    failed: List[str]
+    unchanged: int
 
 
 class MapListener:
@@ -79,59 +328,354 @@ class MapListener:
             kv_prefix: str,
             offset: Optional[str],
             skip_unknown_events: bool,
+            *,
+            prefetch_pages: int = 0,
+            commit_policy: Optional[CommitPolicy] = None,
+            lazy_event_data: bool = False,
+            trusted_events: bool = False,
+            validation_sample_rate: float = 0.0,
+            long_poll_scheduler: Optional[LongPollScheduler] = None,
+            stream_pages: bool = False,
+            page_sizer: Optional[PageSizer] = None,
+            backoff: Optional[ExponentialBackoff] = None,
+            circuit_breaker: Optional[CircuitBreaker] = None,
+            dispatcher: Optional[ConcurrentDispatcher] = None,
+            parse_executor: Optional[Executor] = None,
+            parse_offload_threshold: int = 50,
+            buffer_limits: Optional[BufferLimits] = None,
+            metrics: Optional[MapMetrics] = None,
+            tracer: Optional[Tracer] = None,
+            event_types: Optional[AbstractSet[EventType]] = None,
+            offset_store: Optional[OffsetStore] = None,
+            startup_scheduler: Optional[StartupScheduler] = None,
+            persist_notify_version: bool = False,
+            dedupe_window: int = 0,
+            persist_dedupe: bool = False,
     ):
         self._api = api
         self._consumer = consumer
-        self._events_per_request = events_per_request
+        self._page_sizer = page_sizer or PageSizer(events_per_request)
         self._map_id = map_id
         self._kv_prefix = kv_prefix
         self._offset = offset
-        self._skip_unknown_events = skip_unknown_events
+        self._parser = EventParser(
+            skip_unknown_events, lazy_event_data, trusted_events, validation_sample_rate, event_types
+        )
+        self._prefetch_pages = prefetch_pages
+        self._commit_policy = commit_policy or CommitEachEvent()
+        self._long_poll_scheduler = long_poll_scheduler
+        self._stream_pages = stream_pages
+        self._backoff = backoff or ExponentialBackoff()
+        self._circuit_breaker = circuit_breaker
+        self._retry_attempt = 0
+        self._dispatcher = dispatcher
+        self._parse_executor = parse_executor
+        self._parse_offload_threshold = parse_offload_threshold
+        self._buffer_limits = buffer_limits
+        self._buffer: Optional[PageBuffer] = None
+        self._metrics = metrics or MapMetrics()
+        self._tracer = tracer or Tracer()
+        self._offset_store = offset_store
+        self._startup_scheduler = startup_scheduler
+        self._persist_notify_version = persist_notify_version
+        self._notify_version = offset_store.load_version(map_id) if persist_notify_version else None
+        self._recent: Optional[RecentOffsets] = None
+        if dedupe_window > 0:
+            self._recent = RecentOffsets(dedupe_window, offset_store.load_processed(map_id) if persist_dedupe else ())
+        self._persist_dedupe = persist_dedupe
+        self._batch_consumer = type(consumer).consume_batch is not EventConsumer.consume_batch
+        self._pending_offset: Optional[str] = None
+        self._pending_events = 0
+        self._last_commit_time = time.monotonic()
+
+    @property
+    def kv_prefix(self) -> str:
+        return self._kv_prefix
+
+    @property
+    def page_size(self) -> int:
+        return self._page_sizer.size
+
+    def buffer_stats(self) -> Optional[dict]:
+        return self._buffer.stats() if self._buffer is not None else None
 
     async def listen(self):
         logger.info(f'[{self._map_id}] Map listener started')
 
-        while True:
+        try:
+            if self._startup_scheduler is not None:
+                await self._startup_scheduler.admit(self._map_id, self._offset)
+            while True:
+                try:
+                    await self._events_loop()
+                except CancelledError:
+                    raise
+                except Exception:
+                    self._metrics.observe_error()
+                    self._retry_attempt += 1
+                    delay = self._backoff.delay(self._retry_attempt)
+                    logger.exception(f"[{self._map_id}] Error in events loop, retry in {delay:.1f} s")
+                    await asyncio.sleep(delay)
+        except CancelledError:
             try:
-                await self._events_loop()
-            except CancelledError:
+                await self._flush_commit()
+            finally:
                 await self._consumer.close()
-                break
-            except Exception:
-                # todo exp. timeout
-                logger.exception(f"[{self._map_id}] Error in events loop")
-                await asyncio.sleep(60)
 
         logger.info(f"[{self._map_id}] Map listener stopped")
 
     async def _events_loop(self):
         logger.info(f"[{self._map_id}] Initial kv offset = {self._offset}")
 
-        notify_last = await self._api.get_map_notify_last(self._map_id, self._kv_prefix)
-        self._offset = self._offset or notify_last.value
+        if self._persist_notify_version and self._offset is not None and self._notify_version is not None:
+            # pages are read from the offset anyway, the version is only needed to wait for new events
+            notify_last = KvNotifyLast(value=self._offset, version=self._notify_version)
+        else:
+            async with breaker_guard(self._circuit_breaker):
+                notify_last = await self._api.get_map_notify_last(self._map_id, self._kv_prefix)
+            self._offset = self._offset or notify_last.value
+            self._set_notify_version(notify_last.version)
         logger.info(f"[{self._map_id}] Initial notify last version = {notify_last.version}")
 
+        pages = self._read_pages(notify_last)
+        if self._prefetch_pages > 0 or self._buffer_limits is not None:
+            pages = self._prefetch(pages)
+
+        async for page in pages:
+            started = time.monotonic()
+            if len(page.entries) == 0:
+                await self._maybe_commit(page.end)
+            else:
+                self._metrics.observe_caught_up(False)
+                entries = await self._parse_page(page)
+                if self._batch_consumer:
+                    await self._consume_page_batch(page, entries)
+                elif self._dispatcher is not None:
+                    await self._consume_page_concurrently(page, entries)
+                else:
+                    await self._consume_page(page, entries)
+            if len(page.entries) != 0:
+                self._page_sizer.observe_consume(len(page.entries), time.monotonic() - started)
+            if page.drained:
+                # nothing left to read, so commit before waiting for new events
+                await self._flush_commit()
+                self._metrics.observe_caught_up(True)
+
+    async def _read_pages(self, notify_last: KvNotifyLast) -> AsyncIterator['_Page']:
+        """ Yields pages of events, waits for new events when the queue is drained """
+        offset = self._offset
+
         while True:
-            events = await self._api.get_map_notify(
-                self._map_id, self._kv_prefix, self._offset, self._events_per_request
-            )
-            if len(events) != 0:
-                logger.info(f"[{self._map_id}] Read {len(events)} events")
-            for event in events:
-                offset = event.key[-1]
-                await process_event(self._map_id, self._consumer.consume, event, self._skip_unknown_events)
-                await self._consumer.commit(offset)
-                self._offset = offset
-                logger.info(f"[{self._map_id}] New KV offset = {self._offset}")
-            if len(events) < self._events_per_request:
-                new_notify_last = await self._api.wait_for_map_notify_last(
-                    self._map_id,
-                    self._kv_prefix,
-                    notify_last.version
-                )
+            limit = self._page_sizer.size
+            started = time.monotonic()
+            if self._stream_pages:
+                count = 0
+                # time of the request without consumption of yielded entries
+                fetch_seconds = 0.0
+                resumed = started
+                # the span includes consumption of the streamed events
+                with self._tracer.span(TraceStage.get_map_notify, self._map_id, offset):
+                    async with breaker_guard(self._circuit_breaker):
+                        entries = self._api.iter_map_notify(self._map_id, self._kv_prefix, offset, limit)
+                        async for entry in entries:
+                            fetch_seconds += time.monotonic() - resumed
+                            count += 1
+                            offset = entry.key[-1]
+                            yield _Page([entry], end=False, drained=False)
+                            resumed = time.monotonic()
+                fetch_seconds += time.monotonic() - resumed
+                self._metrics.observe_request('get_map_notify', fetch_seconds)
+                self._metrics.observe_page(count)
+                # consumption is observed by observe_consume already
+                self._page_sizer.observe_fetch(limit, count, fetch_seconds)
+                if count != 0:
+                    yield _Page([], end=True, drained=count < limit)
+            else:
+                with self._tracer.span(TraceStage.get_map_notify, self._map_id, offset):
+                    async with breaker_guard(self._circuit_breaker):
+                        events = await self._api.get_map_notify(self._map_id, self._kv_prefix, offset, limit)
+                count = len(events)
+                self._metrics.observe_request('get_map_notify', time.monotonic() - started)
+                self._metrics.observe_page(count)
+                self._page_sizer.observe_fetch(limit, count, time.monotonic() - started)
+                if count != 0:
+                    offset = events[-1].key[-1]
+                    yield _Page(events, end=True, drained=count < limit, size=getattr(events, 'raw_size', 0))
+
+            if count != 0:
+                logger.info(f"[{self._map_id}] Read {count} events")
+            else:
+                # nothing new as of this request, so the consumer is caught up, once it reaches this page
+                yield _Page([], end=True, drained=True)
+            if count < limit:
+                new_notify_last = await self._wait_for_notify_last(notify_last.version)
+                # long-poll without errors, the map is healthy again
+                self._retry_attempt = 0
                 if new_notify_last is not None:
                     logger.info(f"[{self._map_id}] New notify last version = {new_notify_last.version}")
                     notify_last = new_notify_last
+                    self._set_notify_version(notify_last.version)
+
+    def _set_notify_version(self, version: str):
+        self._notify_version = version
+        if self._persist_notify_version:
+            self._offset_store.commit_version(self._map_id, version)
+
+    async def _wait_for_notify_last(self, version: str) -> Optional[KvNotifyLast]:
+        async def poll():
+            started = time.monotonic()
+            with self._tracer.span(TraceStage.wait_for_map_notify_last, self._map_id):
+                notify_last = await self._api.wait_for_map_notify_last(self._map_id, self._kv_prefix, version)
+            self._metrics.observe_request('wait_for_map_notify_last', time.monotonic() - started)
+            return notify_last
+
+        if self._long_poll_scheduler is None:
+            return await poll()
+        return await self._long_poll_scheduler.wait(poll)
+
+    async def _prefetch(self, pages: AsyncIterator['_Page']) -> AsyncIterator['_Page']:
+        """ Reads pages in background, so the next page is requested while the current one is consumed """
+        buffer = self._buffer = PageBuffer(self._buffer_limits, self._prefetch_pages)
+
+        async def fetch():
+            async for page in pages:
+                await buffer.put(page, len(page.entries), page.size)
+
+        fetcher = asyncio.ensure_future(fetch())
+        getter = None
+        try:
+            while True:
+                getter = asyncio.ensure_future(buffer.get())
+                await asyncio.wait([getter, fetcher], return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    # fetcher never completes normally, so it has failed
+                    fetcher.result()
+                yield getter.result()
+        finally:
+            if getter is not None:
+                getter.cancel()
+            fetcher.cancel()
+
+    async def _parse_page(self, page: '_Page') -> List[Tuple[str, ParsedEntry]]:
+        recent = self._recent
+        if recent is None or not any(entry.key[-1] in recent for entry in page.entries):
+            return await self._parse_entries(page.entries)
+
+        # redelivered entries are not parsed, but still passed on, so their offsets are committed
+        fresh = [entry for entry in page.entries if entry.key[-1] not in recent]
+        logger.info(f"[{self._map_id}] Skipped {len(page.entries) - len(fresh)} redelivered events")
+        parsed = iter(await self._parse_entries(fresh) if len(fresh) != 0 else ())
+        return [
+            (entry.key[-1], []) if entry.key[-1] in recent else next(parsed)
+            for entry in page.entries
+        ]
+
+    async def _parse_entries(self, entries: List[KvEntry]) -> List[Tuple[str, ParsedEntry]]:
+        with self._tracer.span(TraceStage.parse, self._map_id, entries[-1].key[-1]):
+            if self._parse_executor is not None and len(entries) >= self._parse_offload_threshold:
+                return await asyncio.get_event_loop().run_in_executor(
+                    self._parse_executor, self._parser.parse_page, self._map_id, entries
+                )
+            return self._parser.parse_page(self._map_id, entries)
+
+    async def _consume_page(self, page: '_Page', entries: List[Tuple[str, ParsedEntry]]):
+        last = len(entries) - 1
+        for i, (offset, events) in enumerate(entries):
+            logger.debug(f"[{self._map_id}] Processing events {events}")
+            with self._tracer.span(TraceStage.consume, self._map_id, offset):
+                await consume_events(self._map_id, self._consume_event, events)
+            await self._processed(offset)
+            self._consumed(offset, 1)
+            await self._maybe_commit(page.end and i == last)
+
+    async def _consume_page_batch(self, page: '_Page', entries: List[Tuple[str, ParsedEntry]]):
+        batch = []
+        for _, events in entries:
+            batch.extend(events)
+
+        if len(batch) != 0:
+            started = time.monotonic()
+            try:
+                with self._tracer.span(TraceStage.consume, self._map_id, entries[-1][0]):
+                    await self._consumer.consume_batch(batch)
+            except CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"[{self._map_id}] Error in batch processing")
+            self._metrics.observe_consume('batch', time.monotonic() - started, len(batch))
+
+        for offset, _ in entries:
+            await self._processed(offset)
+        self._consumed(page.entries[-1].key[-1], len(page.entries))
+        await self._maybe_commit(page.end)
+
+    async def _consume_page_concurrently(self, page: '_Page', entries: List[Tuple[str, ParsedEntry]]):
+        async def consume(offset: str, events: ParsedEntry):
+            with self._tracer.span(TraceStage.consume, self._map_id, offset):
+                await consume_events(self._map_id, self._consume_event, events)
+            await self._processed(offset)
+
+        async def progress(offset: str, count: int, completed: bool):
+            self._consumed(offset, count)
+            await self._maybe_commit(page.end and completed)
+
+        await self._dispatcher.dispatch(entries, consume, progress)
+
+    async def _consume_event(self, timestamp: datetime, event: TypedMapEvent):
+        started = time.monotonic()
+        try:
+            await self._consumer.consume(timestamp, event)
+        finally:
+            self._metrics.observe_consume(event.type.value, time.monotonic() - started)
+
+    async def _processed(self, offset: str):
+        if self._recent is not None:
+            self._recent.add(offset)
+            if self._persist_dedupe:
+                await self._offset_store.commit_processed(self._map_id, offset)
+
+    def _consumed(self, offset: str, count: int):
+        self._retry_attempt = 0
+        self._offset = offset
+        self._pending_offset = offset
+        self._pending_events += count
+
+    async def _maybe_commit(self, page_end: bool):
+        if self._pending_offset is None:
+            return
+        since_last_commit_ms = (time.monotonic() - self._last_commit_time) * 1000
+        if self._commit_policy.should_commit(self._pending_events, since_last_commit_ms, page_end):
+            await self._flush_commit()
+
+    async def _flush_commit(self):
+        if self._pending_offset is None:
+            return
+        offset = self._pending_offset
+        with self._tracer.span(TraceStage.commit, self._map_id, offset):
+            await self._consumer.commit(offset)
+            if self._offset_store is not None:
+                await self._offset_store.commit(self._map_id, offset)
+        self._pending_offset = None
+        self._pending_events = 0
+        self._last_commit_time = time.monotonic()
+        self._metrics.observe_commit(offset)
+        logger.info(f"[{self._map_id}] New KV offset = {offset}")
+
+
+class _Page:
+    """ Entries read by one request, or a part of them when the response is streamed """
+    __slots__ = ('entries', 'end', 'drained', 'size')
+
+    def __init__(self, entries: List[KvEntry], end: bool, drained: bool, size: int = 0):
+        """
+        :param end: whether it is the last part of the response
+        :param drained: whether the response has less entries than requested, so there is nothing left to read
+        :param size: size of the raw response, 0 if unknown
+        """
+        self.entries = entries
+        self.end = end
+        self.drained = drained
+        self.size = size
 
 
 async def process_event(
@@ -142,18 +686,17 @@ async def process_event(
 ):
     logger.debug(f"[{map_id}] Processing event {event}")
 
-    try:
-        offset = event.key[-1]
-        timestamp = datetime.utcfromtimestamp(int(offset) / 1000)
-        events = parse_compound_event(map_id, event.value, skip_unknown_events)
-    except (ValidationError, ValueError, IndexError):
-        if skip_unknown_events:
-            logger.exception(f"[{map_id}] Error in event parsing, event = {event}")
-            return
-        raise
+    events = EventParser(skip_unknown_events).parse_entry(map_id, event)
+    await consume_events(map_id, consume, events)
+
 
+async def consume_events(
+        map_id: str,
+        consume: EventConsumerCallback,
+        events: List[Tuple[datetime, TypedMapEvent]],
+):
     try:
-        for event in events:
+        for timestamp, event in events:
             await consume(timestamp, event)
     except CancelledError:
         raise
@@ -162,20 +705,4 @@ async def process_event(
 
 
 def parse_compound_event(map_id: str, json: dict, skip_unknown_events=False) -> List[TypedMapEvent]:
-    event = CompoundMapEvent(**json)
-    additional = event.additional or []
-
-    result = [any_event_to_typed(event)]
-
-    for e in additional:
-        json = dict(**e)
-        json['who'] = event.who
-        try:
-            parsed = AnyMapEvent(**json)
-            result.append(any_event_to_typed(parsed))
-        except ValidationError:
-            if not skip_unknown_events:
-                raise
-            logger.exception(f"[{map_id}] Error in event parsing, event = {event}")
-
-    return result
+    return EventParser(skip_unknown_events).parse_compound_event(map_id, json)
@@ -0,0 +1,271 @@
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Optional, Sequence, Deque, List, Tuple, Iterable
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # the last count is for values above all buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: 'Histogram'):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """ Count of values less or equal to every bucket, as in Prometheus """
+        result = []
+        total = 0
+        for bound, count in zip([*map(_format_value, self.buckets), '+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'avg': self.sum / self.count if self.count else 0.0,
+            'buckets': dict(self.cumulative()),
+        }
+
+
+class RateMeter:
+    """ Average rate per second over the last `window` seconds """
+
+    def __init__(self, window: int = 60):
+        self._window = window
+        self._started = time.monotonic()
+        self._seconds: Deque[List[int]] = deque()
+
+    def mark(self, count: int = 1):
+        second = int(time.monotonic())
+        if len(self._seconds) != 0 and self._seconds[-1][0] == second:
+            self._seconds[-1][1] += count
+        else:
+            self._seconds.append([second, count])
+            self._expire(second)
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        self._expire(int(now))
+        elapsed = min(self._window, max(now - self._started, 1))
+        return sum(count for _, count in self._seconds) / elapsed
+
+    def _expire(self, second: int):
+        while len(self._seconds) != 0 and self._seconds[0][0] <= second - self._window:
+            self._seconds.popleft()
+
+
+class MapMetrics:
+    """ Metrics of one map, not recorded by default """
+
+    def observe_request(self, request: str, seconds: float):
+        pass
+
+    def observe_page(self, events: int):
+        pass
+
+    def observe_consume(self, event_type: str, seconds: float, events: int = 1):
+        pass
+
+    def observe_commit(self, offset: str):
+        pass
+
+    def observe_caught_up(self, caught_up: bool):
+        pass
+
+    def observe_error(self):
+        pass
+
+
+class RecordedMapMetrics(MapMetrics):
+    def __init__(self, buckets: Sequence[float], rate_window: int):
+        self._buckets = buckets
+        self.events = 0
+        self.pages = 0
+        self.events_rate = RateMeter(rate_window)
+        self.request_seconds: Dict[str, Histogram] = {}
+        self.consume_seconds: Dict[str, Histogram] = {}
+        self.committed_offset: Optional[str] = None
+        self.committed_timestamp: Optional[float] = None
+        self.caught_up = False
+        self.caught_up_timestamp: Optional[float] = None
+
+    def observe_request(self, request: str, seconds: float):
+        self._histogram(self.request_seconds, request).observe(seconds)
+
+    def observe_page(self, events: int):
+        self.pages += 1
+
+    def observe_consume(self, event_type: str, seconds: float, events: int = 1):
+        self.events += events
+        self.events_rate.mark(events)
+        self._histogram(self.consume_seconds, event_type).observe(seconds)
+
+    def observe_commit(self, offset: str):
+        self.committed_offset = offset
+        try:
+            # offset is the millisecond timestamp of the event
+            self.committed_timestamp = int(offset) / 1000
+        except ValueError:
+            self.committed_timestamp = None
+
+    def observe_caught_up(self, caught_up: bool):
+        self.caught_up = caught_up
+        if caught_up:
+            self.caught_up_timestamp = time.time()
+
+    def observe_error(self):
+        # the map is not known to be caught up until it reads events again
+        self.caught_up = False
+
+    def lag(self) -> Optional[float]:
+        """
+        0 when all events of the map are consumed, otherwise seconds since the latest moment,
+        up to which all events were consumed: the last committed event or the last request without new events
+        """
+        if self.caught_up:
+            return 0.0
+        timestamps = [t for t in (self.committed_timestamp, self.caught_up_timestamp) if t is not None]
+        if len(timestamps) == 0:
+            return None
+        return max(0.0, time.time() - max(timestamps))
+
+    def _histogram(self, histograms: Dict[str, Histogram], key: str) -> Histogram:
+        histogram = histograms.get(key, None)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self._buckets)
+        return histogram
+
+
+class MetricsRegistry:
+    """
+    Metrics of all maps of one or several MapsListener instances,
+    exported as a dict or in Prometheus text format.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, rate_window: int = 60):
+        """
+        :param buckets: upper bounds in seconds of latency histograms
+        :param rate_window: events per second are averaged over this count of seconds
+        """
+        self._buckets = buckets
+        self._rate_window = rate_window
+        self._maps: Dict[str, RecordedMapMetrics] = {}
+
+    def map(self, map_id: str) -> RecordedMapMetrics:
+        metrics = self._maps.get(map_id, None)
+        if metrics is None:
+            metrics = self._maps[map_id] = RecordedMapMetrics(self._buckets, self._rate_window)
+        return metrics
+
+    def remove_map(self, map_id: str):
+        self._maps.pop(map_id, None)
+
+    def snapshot(self) -> dict:
+        maps = {map_id: self._map_snapshot(metrics) for map_id, metrics in self._maps.items()}
+        lags = [m['lag_seconds'] for m in maps.values() if m['lag_seconds'] is not None]
+        return {
+            'maps': maps,
+            'total': {
+                'events': sum(m['events'] for m in maps.values()),
+                'events_per_second': sum(m['events_per_second'] for m in maps.values()),
+                'pages': sum(m['pages'] for m in maps.values()),
+                'max_lag_seconds': max(lags) if len(lags) != 0 else None,
+                'request_seconds': self._merged_snapshot(m.request_seconds for m in self._maps.values()),
+                'consume_seconds': self._merged_snapshot(m.consume_seconds for m in self._maps.values()),
+            },
+        }
+
+    def prometheus(self, prefix: str = 'rf_listener') -> str:
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+
+        def sample(name: str, labels: Dict[str, str], value: float):
+            lines.append(f'{prefix}_{name}{_format_labels(labels)} {_format_value(value)}')
+
+        def histograms(name: str, label: str, get: str):
+            for map_id, metrics in self._maps.items():
+                for key, histogram in getattr(metrics, get).items():
+                    labels = {'map_id': map_id, label: key}
+                    for bound, count in histogram.cumulative():
+                        sample(f'{name}_bucket', {**labels, 'le': bound}, count)
+                    sample(f'{name}_sum', labels, histogram.sum)
+                    sample(f'{name}_count', labels, histogram.count)
+
+        metric('events_total', 'counter', 'Consumed events')
+        for map_id, metrics in self._maps.items():
+            sample('events_total', {'map_id': map_id}, metrics.events)
+
+        metric('events_per_second', 'gauge', 'Consumed events per second')
+        for map_id, metrics in self._maps.items():
+            sample('events_per_second', {'map_id': map_id}, metrics.events_rate.rate())
+
+        metric('pages_total', 'counter', 'Fetched pages of events')
+        for map_id, metrics in self._maps.items():
+            sample('pages_total', {'map_id': map_id}, metrics.pages)
+
+        metric('lag_seconds', 'gauge', 'Seconds since the last committed event, 0 when the map is caught up')
+        for map_id, metrics in self._maps.items():
+            lag = metrics.lag()
+            if lag is not None:
+                sample('lag_seconds', {'map_id': map_id}, lag)
+
+        metric('request_seconds', 'histogram', 'Latency of events API requests')
+        histograms('request_seconds', 'request', 'request_seconds')
+
+        metric('consume_seconds', 'histogram', 'Latency of event consumption')
+        histograms('consume_seconds', 'event_type', 'consume_seconds')
+
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _map_snapshot(metrics: RecordedMapMetrics) -> dict:
+        return {
+            'events': metrics.events,
+            'events_per_second': metrics.events_rate.rate(),
+            'pages': metrics.pages,
+            'committed_offset': metrics.committed_offset,
+            'lag_seconds': metrics.lag(),
+            'request_seconds': {k: h.snapshot() for k, h in metrics.request_seconds.items()},
+            'consume_seconds': {k: h.snapshot() for k, h in metrics.consume_seconds.items()},
+        }
+
+    def _merged_snapshot(self, groups: Iterable[Dict[str, Histogram]]) -> dict:
+        merged: Dict[str, Histogram] = {}
+        for histograms in groups:
+            for key, histogram in histograms.items():
+                merged.setdefault(key, Histogram(self._buckets)).merge(histogram)
+        return {k: h.snapshot() for k, h in merged.items()}
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    return '{' + ','.join(f'{k}="{_escape_label_value(v)}"' for k, v in labels.items()) + '}'
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
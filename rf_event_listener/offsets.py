@@ -0,0 +1,351 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from asyncio import Task, CancelledError
+from concurrent.futures import Executor
+from typing import Dict, Optional, List, Iterable, Iterator
+
+logger = logging.getLogger('rf_maps_listener')
+
+
+def _after(offsets: Iterable[str], committed: Optional[str]) -> List[str]:
+    return [offset for offset in offsets if committed is None or offset > committed]
+
+
+class OffsetStore:
+    """
+    Durable committed offsets of maps, e.g. MapsListener(offset_store=...).
+
+    Commits are grouped: only the latest offset of every map is kept in memory
+    and written once `flush_events` commits are collected or `flush_interval_ms` passed since the first of them.
+    Offsets of the last group are lost on crash, so their events are consumed again after restart.
+
+    Last known notify versions of maps and offsets of entries processed after the committed offset
+    are optionally stored too, see `persist_notify_version` and `persist_dedupe` of MapsListener.
+    Processed offsets are grouped with commits, and only new ones are written.
+    """
+
+    def __init__(
+            self,
+            flush_interval_ms: float = 1000,
+            flush_events: int = 1000,
+            executor: Optional[Executor] = None,
+    ):
+        """
+        :param executor: runs blocking writes, default executor of the event loop by default
+        """
+        self._flush_interval_ms = flush_interval_ms
+        self._flush_events = flush_events
+        self._executor = executor
+        self._offsets: Dict[str, str] = {}
+        self._pending: Dict[str, str] = {}
+        self._pending_events = 0
+        self._versions: Dict[str, str] = {}
+        self._pending_versions: Dict[str, str] = {}
+        # processed offsets after the committed offset of every map
+        self._processed: Dict[str, List[str]] = {}
+        self._pending_processed: Dict[str, List[str]] = {}
+        # the group being written, still visible to load
+        self._flushing: Dict[str, str] = {}
+        self._flushing_versions: Dict[str, str] = {}
+        self._flushing_processed: Dict[str, List[str]] = {}
+        self._timer: Optional[Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def load(self, map_id: str) -> Optional[str]:
+        """ Last committed offset of the map, to pass it as `initial_offset` """
+        return self._pending.get(map_id) or self._flushing.get(map_id) or self._offsets.get(map_id)
+
+    async def load_committed(self, map_id: str) -> Optional[str]:
+        """
+        Last committed offset of the map read from the storage, so commits of other stores are seen too,
+        e.g. of another node, which owned the map before
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # not concurrently with writes
+        async with self._lock:
+            offset = await asyncio.get_event_loop().run_in_executor(self._executor, self._read_offset, map_id)
+        return offset if offset is not None else self.load(map_id)
+
+    def load_version(self, map_id: str) -> Optional[str]:
+        """ Last known notify version of the map """
+        return (
+            self._pending_versions.get(map_id)
+            or self._flushing_versions.get(map_id)
+            or self._versions.get(map_id)
+        )
+
+    def load_processed(self, map_id: str) -> List[str]:
+        """ Offsets of entries of the map processed after its committed offset """
+        processed = (
+            self._processed.get(map_id, [])
+            + self._flushing_processed.get(map_id, [])
+            + self._pending_processed.get(map_id, [])
+        )
+        return _after(processed, self.load(map_id))
+
+    async def commit(self, map_id: str, offset: str):
+        self._pending[map_id] = offset
+        await self._added()
+
+    async def commit_processed(self, map_id: str, offset: str):
+        """ Written with the next group, dropped once the map commits this offset """
+        self._pending_processed.setdefault(map_id, []).append(offset)
+        await self._added()
+
+    async def _added(self):
+        self._pending_events += 1
+        if self._pending_events >= self._flush_events:
+            await self.flush()
+        else:
+            self._schedule_flush()
+
+    def commit_version(self, map_id: str, version: str):
+        """ Written with the next group of offsets """
+        self._pending_versions[map_id] = version
+        self._schedule_flush()
+
+    async def flush(self):
+        """ Writes pending offsets """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if len(self._pending) == 0 and len(self._pending_versions) == 0 and len(self._pending_processed) == 0:
+                return
+            offsets, versions, processed = self._pending, self._pending_versions, self._pending_processed
+            self._pending, self._pending_versions, self._pending_processed = {}, {}, {}
+            self._flushing, self._flushing_versions, self._flushing_processed = offsets, versions, processed
+            self._pending_events = 0
+            write = asyncio.get_event_loop().run_in_executor(self._executor, self._write, offsets, versions, processed)
+            try:
+                await asyncio.shield(write)
+            except CancelledError:
+                # the thread can not be interrupted, so the storage is not used by others until it ends
+                await asyncio.wait([write])
+                self._written(write.exception() is None)
+                raise
+            except Exception:
+                self._written(False)
+                raise
+            self._written(True)
+
+    def _written(self, success: bool):
+        offsets, versions, processed = self._flushing, self._flushing_versions, self._flushing_processed
+        self._flushing, self._flushing_versions, self._flushing_processed = {}, {}, {}
+        if success:
+            self._offsets.update(offsets)
+            self._versions.update(versions)
+            self._processed = self._merge_processed(self._offsets, processed)
+            return
+        # keep offsets for the next flush, unless they are already replaced by newer ones
+        for map_id, offset in offsets.items():
+            self._pending.setdefault(map_id, offset)
+        for map_id, version in versions.items():
+            self._pending_versions.setdefault(map_id, version)
+        for map_id, new in processed.items():
+            self._pending_processed[map_id] = new + self._pending_processed.get(map_id, [])
+
+    async def close(self):
+        """ Flushes pending offsets and releases the storage """
+        if self._timer is not None:
+            # the timer is reset before its flush, so it is cancelled only while sleeping,
+            # a running flush holds the lock until its group is written
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+        self._close()
+
+    def _schedule_flush(self):
+        if self._timer is None:
+            self._timer = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self._flush_interval_ms / 1000)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception('Error in flush of offsets')
+
+    def _merge_processed(self, offsets: Dict[str, str], processed: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """ Stored processed offsets with new ones, without committed ones """
+        merged = {}
+        for map_id in self._processed.keys() | processed.keys():
+            new = _after(self._processed.get(map_id, []) + processed.get(map_id, []), offsets.get(map_id))
+            if len(new) != 0:
+                merged[map_id] = new
+        return merged
+
+    def _write(self, offsets: Dict[str, str], versions: Dict[str, str], processed: Dict[str, List[str]]):
+        """
+        Persists latest offsets and notify versions of maps and newly processed offsets, called in executor.
+        Processed offsets up to the committed offset of a map are not needed anymore.
+        """
+        raise NotImplementedError()
+
+    def _read_offset(self, map_id: str) -> Optional[str]:
+        """ Committed offset of the map in the storage, called in executor """
+        raise NotImplementedError()
+
+    def _close(self):
+        pass
+
+
+_RECORD_KEYS = ('offset', 'notify_version', 'processed')
+
+
+class FileOffsetStore(OffsetStore):
+    """
+    Appends committed offsets to a file as JSON lines, the last line of a map wins.
+    The file is rewritten with only the latest offsets, when it grows to `compact_lines`.
+    """
+
+    def __init__(self, path: str, fsync: bool = True, compact_lines: int = 100000, **kwargs):
+        """
+        :param fsync: wait until every group is written to the disk
+        :param compact_lines: the file is compacted when it has more lines, and twice more than the count of maps
+        :param kwargs: see OffsetStore
+        """
+        super().__init__(**kwargs)
+        self._path = path
+        self._fsync = fsync
+        self._compact_lines = compact_lines
+        self._lines = 0
+        self._read()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _read(self):
+        for record in self._records():
+            if 'notify_version' in record:
+                self._versions[record['map_id']] = record['notify_version']
+            elif 'processed' in record:
+                self._processed.setdefault(record['map_id'], []).extend(record['processed'])
+            else:
+                self._offsets[record['map_id']] = record['offset']
+        self._processed = self._merge_processed(self._offsets, {})
+
+    def _read_offset(self, map_id: str) -> Optional[str]:
+        offset = None
+        for record in self._records():
+            if record['map_id'] == map_id and 'offset' in record:
+                offset = record['offset']
+        return offset
+
+    def _records(self) -> Iterator[dict]:
+        if not os.path.exists(self._path):
+            return
+        with open(self._path, encoding='utf-8') as f:
+            lines = 0
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                    valid = 'map_id' in record and any(key in record for key in _RECORD_KEYS)
+                except (ValueError, TypeError):
+                    valid = False
+                if not valid:
+                    # line torn by crash during write
+                    logger.warning(f'Skipped malformed line {lines} of {self._path}')
+                    continue
+                yield record
+        self._lines = lines
+
+    def _write(self, offsets: Dict[str, str], versions: Dict[str, str], processed: Dict[str, List[str]]):
+        # processed offsets up to the committed offset are skipped on reading and compaction
+        self._file.write(self._lines_of(offsets, versions, processed))
+        self._flush_file(self._file)
+        self._lines += len(offsets) + len(versions) + len(processed)
+
+        all_offsets = {**self._offsets, **offsets}
+        all_processed = self._merge_processed(all_offsets, processed)
+        records = len(all_offsets) + len(self._versions.keys() | versions.keys()) + len(all_processed)
+        if self._lines > self._compact_lines and self._lines > 2 * records:
+            self._compact(all_offsets, {**self._versions, **versions}, all_processed)
+
+    def _compact(self, offsets: Dict[str, str], versions: Dict[str, str], processed: Dict[str, List[str]]):
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self._lines_of(offsets, versions, processed))
+            self._flush_file(f)
+        self._file.close()
+        os.replace(tmp_path, self._path)
+        self._file = open(self._path, 'a', encoding='utf-8')
+        self._lines = len(offsets) + len(versions) + len(processed)
+
+    def _flush_file(self, f):
+        f.flush()
+        if self._fsync:
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _lines_of(offsets: Dict[str, str], versions: Dict[str, str], processed: Dict[str, List[str]]) -> str:
+        records = [
+            *({'map_id': map_id, 'offset': offset} for map_id, offset in offsets.items()),
+            *({'map_id': map_id, 'notify_version': version} for map_id, version in versions.items()),
+            *({'map_id': map_id, 'processed': new} for map_id, new in processed.items()),
+        ]
+        return ''.join(json.dumps(record) + '\n' for record in records)
+
+    def _close(self):
+        self._file.close()
+
+
+class SqliteOffsetStore(OffsetStore):
+    """ Offsets of many maps in one SQLite database, every group is written in one transaction """
+
+    def __init__(self, path: str, table: str = 'map_offsets', **kwargs):
+        """
+        :param kwargs: see OffsetStore
+        """
+        super().__init__(**kwargs)
+        self._table = table
+        # writes are serialized by flush, but run in executor threads
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        with self._connection:
+            self._connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} (map_id TEXT PRIMARY KEY, offset TEXT NOT NULL)'
+            )
+            self._connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {table}_versions (map_id TEXT PRIMARY KEY, version TEXT NOT NULL)'
+            )
+            self._connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {table}_processed '
+                f'(map_id TEXT NOT NULL, offset TEXT NOT NULL, PRIMARY KEY (map_id, offset))'
+            )
+        self._offsets.update(self._connection.execute(f'SELECT map_id, offset FROM {table}').fetchall())
+        self._versions.update(self._connection.execute(f'SELECT map_id, version FROM {table}_versions').fetchall())
+        for map_id, offset in self._connection.execute(
+                f'SELECT map_id, offset FROM {table}_processed ORDER BY map_id, offset'
+        ):
+            self._processed.setdefault(map_id, []).append(offset)
+        self._processed = self._merge_processed(self._offsets, {})
+
+    def _write(self, offsets: Dict[str, str], versions: Dict[str, str], processed: Dict[str, List[str]]):
+        with self._connection:
+            self._connection.executemany(
+                f'INSERT OR REPLACE INTO {self._table} (map_id, offset) VALUES (?, ?)',
+                offsets.items(),
+            )
+            self._connection.executemany(
+                f'INSERT OR REPLACE INTO {self._table}_versions (map_id, version) VALUES (?, ?)',
+                versions.items(),
+            )
+            self._connection.executemany(
+                f'INSERT OR IGNORE INTO {self._table}_processed (map_id, offset) VALUES (?, ?)',
+                [(map_id, offset) for map_id, new in processed.items() for offset in new],
+            )
+            self._connection.executemany(
+                f'DELETE FROM {self._table}_processed WHERE map_id = ? AND offset <= ?',
+                offsets.items(),
+            )
+
+    def _read_offset(self, map_id: str) -> Optional[str]:
+        row = self._connection.execute(f'SELECT offset FROM {self._table} WHERE map_id = ?', (map_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _close(self):
+        self._connection.close()
@@ -0,0 +1,58 @@
+class PageSizer:
+    """ Count of events requested by one get_map_notify call of one map, constant by default """
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def observe_fetch(self, requested: int, received: int, seconds: float):
+        pass
+
+    def observe_consume(self, count: int, seconds: float):
+        pass
+
+
+class AdaptivePageSizer(PageSizer):
+    """
+    Grows page size while the map has a backlog, so it is caught up with fewer requests,
+    and shrinks it when the map is idle, or when fetching or consuming of a page takes too long.
+    """
+
+    def __init__(
+            self,
+            initial_size: int = 100,
+            min_size: int = 10,
+            max_size: int = 1000,
+            max_fetch_seconds: float = 2.0,
+            max_consume_seconds: float = 10.0,
+            factor: float = 2.0,
+    ):
+        """
+        :param max_fetch_seconds: page size is reduced when get_map_notify takes longer
+        :param max_consume_seconds: page size is reduced when consumption of one page takes longer
+        :param factor: multiplier of page size on every change
+        """
+        super().__init__(min(max(initial_size, min_size), max_size))
+        self._min_size = min_size
+        self._max_size = max_size
+        self._max_fetch_seconds = max_fetch_seconds
+        self._max_consume_seconds = max_consume_seconds
+        self._factor = factor
+
+    def observe_fetch(self, requested: int, received: int, seconds: float):
+        if seconds > self._max_fetch_seconds:
+            self._shrink()
+        elif received >= requested:
+            # full page, there is a backlog
+            self._grow()
+        else:
+            self._shrink()
+
+    def observe_consume(self, count: int, seconds: float):
+        if seconds > self._max_consume_seconds:
+            self._shrink()
+
+    def _grow(self):
+        self.size = min(self._max_size, int(self.size * self._factor))
+
+    def _shrink(self):
+        self.size = max(self._min_size, int(self.size / self._factor))
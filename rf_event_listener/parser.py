@@ -0,0 +1,121 @@
+import functools
+import logging
+import random
+from datetime import datetime
+from typing import List, Tuple, Optional, AbstractSet
+
+from pydantic import ValidationError
+
+from rf_event_listener.api import KvEntry
+from rf_event_listener.events import TypedMapEvent, CompoundMapEvent, parse_typed_event, construct_typed_event, \
+    EventType
+
+logger = logging.getLogger('rf_maps_listener')
+
+# typed events of one kv entry with timestamp
+ParsedEntry = List[Tuple[datetime, TypedMapEvent]]
+
+
+class EventParser:
+    def __init__(
+            self,
+            skip_unknown_events: bool = False,
+            lazy_data: bool = False,
+            trusted: bool = False,
+            validation_sample_rate: float = 0.0,
+            event_types: Optional[AbstractSet[EventType]] = None,
+    ):
+        """
+        :param skip_unknown_events: log and skip events, which can not be parsed, instead of raising
+        :param lazy_data: validate typed `data` of events on first access, see parse_typed_event
+        :param trusted: build events without validation, see construct_typed_event
+        :param validation_sample_rate: fraction of entries, which are validated anyway in trusted mode,
+            so schema changes are still detected; mismatches are logged, constructed events are returned
+        :param event_types: events of other types, including unknown ones, are dropped
+            after reading only their `type`, None parses all events
+        """
+        self._skip_unknown_events = skip_unknown_events
+        self._lazy_data = lazy_data
+        self._trusted = trusted
+        self._validation_sample_rate = validation_sample_rate
+        # values of raw json and members, if events are built from models
+        self._types = frozenset([*event_types, *(t.value for t in event_types)]) if event_types is not None else None
+
+    def parse_page(self, map_id: str, entries: List[KvEntry]) -> List[Tuple[str, ParsedEntry]]:
+        """ Parses entries with their offsets, picklable to run in a process pool """
+        return [(entry.key[-1], self.parse_entry(map_id, entry)) for entry in entries]
+
+    def parse_entry(self, map_id: str, entry: KvEntry) -> ParsedEntry:
+        """ Parses kv entry into typed events with timestamp, which is encoded in the entry offset """
+        try:
+            offset = entry.key[-1]
+            timestamp = datetime.utcfromtimestamp(int(offset) / 1000)
+            events = self.parse_compound_event(map_id, entry.value)
+        except (ValidationError, ValueError, IndexError):
+            if self._skip_unknown_events:
+                logger.exception(f"[{map_id}] Error in event parsing, event = {entry}")
+                return []
+            raise
+
+        return [(timestamp, e) for e in events]
+
+    def parse_compound_event(self, map_id: str, json: dict) -> List[TypedMapEvent]:
+        if not self._trusted:
+            parse = self._parse_event
+        elif random.random() >= self._validation_sample_rate:
+            parse = construct_typed_event
+        else:
+            parse = functools.partial(self._construct_validated, map_id)
+
+        if self._accepts(json):
+            event = parse(json)
+            result = [event]
+            who = event.who
+        else:
+            result = []
+            # validated with additional events, if any of them is accepted
+            who = json.get('who')
+
+        additional = json.get('additional')
+        if additional is None:
+            return result
+        if not isinstance(additional, list) or not all(isinstance(e, dict) for e in additional):
+            # let pydantic report or coerce malformed list
+            additional = CompoundMapEvent(**json).additional or []
+
+        for e in additional:
+            if not self._accepts(e):
+                continue
+            try:
+                result.append(parse({**e, 'who': who}))
+            except ValidationError:
+                if not self._skip_unknown_events:
+                    raise
+                logger.exception(f"[{map_id}] Error in event parsing, event = {json}")
+
+        return result
+
+    def _accepts(self, json: dict) -> bool:
+        if self._types is None:
+            return True
+        try:
+            return json.get('type') in self._types
+        except TypeError:
+            # unhashable type is reported by parsing
+            return True
+
+    def _parse_event(self, json: dict) -> TypedMapEvent:
+        return parse_typed_event(json, self._lazy_data)
+
+    @staticmethod
+    def _construct_validated(map_id: str, json: dict) -> TypedMapEvent:
+        """ Reports schema drift without failing, unsampled events would pass anyway """
+        event = construct_typed_event(json)
+        try:
+            if parse_typed_event(json) == event:
+                return event
+        except ValidationError:
+            logger.warning(f"[{map_id}] Trusted event is not valid, event = {json}", exc_info=True)
+            return event
+        logger.warning(f"[{map_id}] Trusted event differs from the validated one, event = {json}")
+        return event
@@ -0,0 +1,150 @@
+import aiohttp
+import asyncio
+import math
+import random
+import time
+from asyncio import CancelledError, Future
+from typing import Optional
+
+
+class ExponentialBackoff:
+    def __init__(
+            self,
+            initial_delay: float = 0.5,
+            max_delay: float = 60,
+            multiplier: float = 2,
+            jitter: float = 0.5,
+    ):
+        """
+        :param jitter: part of the delay, which is randomized, so maps do not retry in lockstep,
+            1 means any delay from 0 to the exponential one
+        """
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._multiplier = multiplier
+        self._jitter = jitter
+        if multiplier > 1 and 0 < initial_delay < max_delay:
+            self._max_exponent = math.ceil(math.log(max_delay / initial_delay, multiplier))
+        else:
+            self._max_exponent = 0
+
+    def delay(self, attempt: int) -> float:
+        """ Delay in seconds before retry number `attempt`, starting from 1 """
+        # the exponent is capped, so long outages do not overflow
+        delay = self._initial_delay * self._multiplier ** min(attempt - 1, self._max_exponent)
+        delay = min(self._max_delay, delay)
+        return delay * (1 - self._jitter * random.random())
+
+
+class CircuitBreaker:
+    """
+    Shared by map listeners, so an outage of the API produces one stream of probe requests.
+
+    After `failure_threshold` consecutive failed calls the breaker opens and calls wait.
+    Only outages of the API are failures, see is_outage, other errors, e.g. 4xx of a single map, are not.
+    After `reset_timeout` seconds one probe call is let through, its success closes the breaker,
+    its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._changed: Optional[Future] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def is_outage(self, error: BaseException) -> bool:
+        """ Server and transport errors """
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status >= 500
+        return isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+    def guard(self) -> '_BreakerGuard':
+        """
+        Async context manager around a call, waits while the breaker is open,
+        then records success or failure of the call
+        """
+        return _BreakerGuard(self)
+
+    async def _before_call(self) -> bool:
+        """ Returns whether the call is a probe """
+        while self._opened_at is not None:
+            remaining = self._opened_at + self._reset_timeout - time.monotonic()
+            if remaining <= 0 and not self._probing:
+                self._probing = True
+                return True
+            await asyncio.wait([self._changed_future()], timeout=remaining if remaining > 0 else None)
+        return False
+
+    def _record_success(self):
+        self._failures = 0
+        if self._opened_at is not None:
+            self._opened_at = None
+            self._probing = False
+            self._notify()
+
+    def _record_failure(self, probe: bool):
+        self._failures += 1
+        if probe or (self._opened_at is None and self._failures >= self._failure_threshold):
+            self._opened_at = time.monotonic()
+            self._probing = False
+            self._notify()
+
+    def _release_probe(self):
+        self._probing = False
+        self._notify()
+
+    def _changed_future(self) -> Future:
+        if self._changed is None:
+            self._changed = asyncio.get_event_loop().create_future()
+        return self._changed
+
+    def _notify(self):
+        if self._changed is not None:
+            self._changed.set_result(None)
+            self._changed = None
+
+
+class _BreakerGuard:
+    def __init__(self, breaker: CircuitBreaker):
+        self._breaker = breaker
+        self._probe = False
+
+    async def __aenter__(self):
+        self._probe = await self._breaker._before_call()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self._breaker._record_success()
+        elif issubclass(exc_type, (CancelledError, GeneratorExit)):
+            # the call was interrupted, not failed
+            if self._probe:
+                self._breaker._release_probe()
+        elif self._breaker.is_outage(exc_val):
+            self._breaker._record_failure(self._probe)
+        else:
+            # the API responded
+            self._breaker._record_success()
+
+
+class _NoGuard:
+    __slots__ = ()
+
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NO_GUARD = _NoGuard()
+
+
+def breaker_guard(breaker: Optional[CircuitBreaker]):
+    """ CircuitBreaker.guard, which does nothing without a breaker """
+    return breaker.guard() if breaker is not None else _NO_GUARD
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from asyncio import CancelledError
+from multiprocessing.connection import Connection
+from typing import Callable, Optional, Dict, List, Tuple, Set
+
+from rf_event_listener.api import HttpEventsApi
+from rf_event_listener.listener import MapsListener, EventConsumer
+from rf_event_listener.sharding import HashRing
+
+logger = logging.getLogger('rf_maps_listener')
+
+# picklable callables, e.g. module level functions, they are called in worker processes
+ConsumerFactory = Callable[[str], EventConsumer]
+ListenerFactory = Callable[[], MapsListener]
+
+
+def create_http_listener() -> MapsListener:
+    return MapsListener(HttpEventsApi())
+
+
+class MultiProcessRunner:
+    """
+    Runs maps in worker processes, every worker has its own event loop and MapsListener.
+    Maps are partitioned across workers by consistent hashing of map id.
+    Maps added before start or after stop are started with the workers.
+    """
+
+    def __init__(
+            self,
+            consumer_factory: ConsumerFactory,
+            workers: Optional[int] = None,
+            listener_factory: ListenerFactory = create_http_listener,
+            start_method: str = 'spawn',
+    ):
+        """
+        :param consumer_factory: creates consumer of a map by its id in the worker
+        :param workers: count of worker processes, count of CPUs by default
+        :param listener_factory: creates MapsListener with its events api in the worker
+        """
+        self._consumer_factory = consumer_factory
+        self._listener_factory = listener_factory
+        self._context = multiprocessing.get_context(start_method)
+        self._workers: List[Optional[_WorkerHandle]] = [None] * (workers or os.cpu_count() or 1)
+        self._ring = HashRing([str(i) for i in range(len(self._workers))])
+        # map id -> kv prefix and initial offset, which is used only by the first start of the map
+        self._maps: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._health_request = 0
+
+    @property
+    def started(self) -> bool:
+        return self._workers[0] is not None
+
+    def start(self):
+        if self.started:
+            return
+        for i in range(len(self._workers)):
+            self._start_worker(i)
+            self._add_maps_of(i)
+
+    def worker_of(self, map_id: str) -> int:
+        return int(self._ring.owner(map_id))
+
+    def add_map(self, map_id: str, kv_prefix: str, initial_offset: Optional[str] = None):
+        if map_id in self._maps:
+            return
+        self._maps[map_id] = (kv_prefix, initial_offset)
+        if self.started:
+            self._send_add(self.worker_of(map_id), map_id)
+
+    def remove_map(self, map_id: str):
+        if self._maps.pop(map_id, None) is not None and self.started:
+            self._send(self.worker_of(map_id), ('remove', map_id))
+
+    def health(self, timeout: float = 5) -> dict:
+        """ State of workers, a worker is healthy if it is alive and its event loop responds in time """
+        self._check_started()
+        self._health_request += 1
+        request = self._health_request
+        for i in range(len(self._workers)):
+            self._send(i, ('health', request))
+
+        deadline = time.monotonic() + timeout
+        workers = []
+        for i, worker in enumerate(self._workers):
+            state = {'worker': i, 'pid': worker.process.pid, 'alive': worker.process.is_alive(), 'responsive': False}
+            reply = worker.receive(request, deadline) if state['alive'] else None
+            if reply is not None:
+                state.update(reply, responsive=True)
+            workers.append(state)
+
+        return {
+            'healthy': all(w['responsive'] for w in workers),
+            'maps': len(self._maps),
+            'workers': workers,
+        }
+
+    def restart_dead_workers(self) -> List[int]:
+        """ Restarts exited workers with their maps, returns their indexes """
+        self._check_started()
+        restarted = []
+        for i, worker in enumerate(self._workers):
+            if not worker.process.is_alive():
+                logger.warning(f'Worker {i} exited with code {worker.process.exitcode}, restarting')
+                worker.close()
+                self._start_worker(i)
+                self._add_maps_of(i)
+                restarted.append(i)
+        return restarted
+
+    def stop(self, timeout: float = 10):
+        """ Stops listeners, so offsets are committed, and waits for workers to exit """
+        for i, worker in enumerate(self._workers):
+            if worker is not None and worker.process.is_alive():
+                self._send(i, ('stop',))
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            if worker is None:
+                continue
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+            worker.close()
+        self._workers = [None] * len(self._workers)
+
+    def _start_worker(self, index: int):
+        commands, commands_sender = self._context.Pipe(duplex=False)
+        replies_receiver, replies = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_run_worker,
+            args=(index, commands, replies, self._listener_factory, self._consumer_factory),
+            name=f'rf-event-listener-{index}',
+            daemon=True,
+        )
+        process.start()
+        # ends owned by the worker
+        commands.close()
+        replies.close()
+        self._workers[index] = _WorkerHandle(process, commands_sender, replies_receiver)
+
+    def _add_maps_of(self, index: int):
+        for map_id in list(self._maps):
+            if self.worker_of(map_id) == index:
+                self._send_add(index, map_id)
+
+    def _send_add(self, index: int, map_id: str):
+        kv_prefix, initial_offset = self._maps[map_id]
+        if self._send(index, ('add', map_id, kv_prefix, initial_offset)):
+            # restarted workers continue from offset_store of their listener
+            self._maps[map_id] = (kv_prefix, None)
+
+    def _check_started(self):
+        if not self.started:
+            raise RuntimeError('Workers are not started, see MultiProcessRunner.start')
+
+    def _send(self, index: int, command: tuple) -> bool:
+        try:
+            self._workers[index].commands.send(command)
+            return True
+        except (BrokenPipeError, OSError):
+            logger.warning(f'Worker {index} is not running, see restart_dead_workers')
+            return False
+
+
+class _WorkerHandle:
+    def __init__(self, process: multiprocessing.Process, commands: Connection, replies: Connection):
+        self.process = process
+        self.commands = commands
+        self.replies = replies
+
+    def receive(self, request: int, deadline: float) -> Optional[dict]:
+        """ Reply to the health request, replies to timed out requests are skipped """
+        try:
+            while self.replies.poll(max(0.0, deadline - time.monotonic())):
+                reply_request, state = self.replies.recv()
+                if reply_request == request:
+                    return state
+        except (EOFError, OSError):
+            pass
+        return None
+
+    def close(self):
+        self.commands.close()
+        self.replies.close()
+
+
+def _run_worker(
+        index: int,
+        commands: Connection,
+        replies: Connection,
+        listener_factory: ListenerFactory,
+        consumer_factory: ConsumerFactory,
+):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_Worker(index, commands, replies, listener_factory, consumer_factory).run())
+    finally:
+        loop.close()
+
+
+class _Worker:
+    def __init__(
+            self,
+            index: int,
+            commands: Connection,
+            replies: Connection,
+            listener_factory: ListenerFactory,
+            consumer_factory: ConsumerFactory,
+    ):
+        self._index = index
+        self._commands = commands
+        self._replies = replies
+        self._listener_factory = listener_factory
+        self._listener: Optional[MapsListener] = None
+        self._consumer_factory = consumer_factory
+        self._maps: Set[str] = set()
+
+    async def run(self):
+        # sessions of the api are created in the running loop
+        self._listener = self._listener_factory()
+        try:
+            await self._serve()
+        finally:
+            await self._listener.api.close_session()
+
+    async def _serve(self):
+        logger.info(f'Worker {self._index} started')
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                # blocking receive in a thread, so listeners keep running
+                command = await loop.run_in_executor(None, self._commands.recv)
+            except EOFError:
+                # the supervisor has exited
+                command = ('stop',)
+
+            kind = command[0]
+            if kind == 'add':
+                _, map_id, kv_prefix, initial_offset = command
+                self._listener.add_map(map_id, kv_prefix, self._consumer_factory(map_id), initial_offset)
+                self._maps.add(map_id)
+            elif kind == 'remove':
+                await self._remove_map(command[1])
+            elif kind == 'health':
+                self._replies.send((command[1], {'maps_running': len(self._maps)}))
+            elif kind == 'stop':
+                for map_id in list(self._maps):
+                    await self._remove_map(map_id)
+                break
+        logger.info(f'Worker {self._index} stopped')
+
+    async def _remove_map(self, map_id: str):
+        self._maps.discard(map_id)
+        task = self._listener.remove_map(map_id)
+        if task is not None:
+            # the last offset is committed, its failure does not stop other maps of the worker
+            try:
+                await task
+            except CancelledError:
+                pass
+            except Exception:
+                logger.exception(f'[{map_id}] Error in stopping of map listener')
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from asyncio import CancelledError, Future
+from collections import deque
+from typing import Callable, Awaitable, Optional, Deque, TypeVar
+
+T = TypeVar('T')
+
+
+class LongPollScheduler:
+    """
+    Limits count of concurrent long-polls, can be shared by several MapsListener instances.
+
+    Long-polls wait for a free slot in FIFO order. When there are queued long-polls, a running long-poll
+    is interrupted after `slice_timeout` seconds and returns None, as if it timed out, so the map re-reads
+    its events and queues again. This way slots rotate round-robin across all maps.
+    """
+
+    def __init__(self, max_concurrent_waits: int, slice_timeout: float = 10):
+        self._max_concurrent_waits = max_concurrent_waits
+        self._slice_timeout = slice_timeout
+        self._active = 0
+        self._queue: Deque[Future] = deque()
+
+        self._total_waits = 0
+        self._preempted_waits = 0
+        self._queue_delay_total = 0.0
+        self._queue_delay_max = 0.0
+
+    async def wait(self, poll: Callable[[], Awaitable[Optional[T]]]) -> Optional[T]:
+        """ Runs long-poll in a free slot, returns None if it was interrupted in favor of queued ones """
+        queued_at = time.monotonic()
+        await self._acquire()
+        self._record_queue_delay(time.monotonic() - queued_at)
+        try:
+            return await self._poll(poll)
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            'active_waits': self._active,
+            'queued_waits': len(self._queue),
+            'total_waits': self._total_waits,
+            'preempted_waits': self._preempted_waits,
+            'queue_delay_avg': self._queue_delay_total / self._total_waits if self._total_waits else 0.0,
+            'queue_delay_max': self._queue_delay_max,
+        }
+
+    async def _acquire(self):
+        if self._active < self._max_concurrent_waits and len(self._queue) == 0:
+            self._active += 1
+            return
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._queue.append(waiter)
+        try:
+            # the slot is handed over by _release without changing the active count
+            await waiter
+        except CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            elif waiter in self._queue:
+                # a cancelled waiter may have been popped by _release already
+                self._queue.remove(waiter)
+            raise
+
+    def _has_waiters(self) -> bool:
+        return any(not waiter.done() for waiter in self._queue)
+
+    def _release(self):
+        while len(self._queue) != 0:
+            waiter = self._queue.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    async def _poll(self, poll: Callable[[], Awaitable[Optional[T]]]) -> Optional[T]:
+        task = asyncio.ensure_future(poll())
+        try:
+            while True:
+                await asyncio.wait([task], timeout=self._slice_timeout)
+                if task.done():
+                    return task.result()
+                if self._has_waiters():
+                    self._preempted_waits += 1
+                    return None
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def _record_queue_delay(self, delay: float):
+        self._total_waits += 1
+        self._queue_delay_total += delay
+        self._queue_delay_max = max(self._queue_delay_max, delay)
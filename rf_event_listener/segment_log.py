@@ -0,0 +1,273 @@
+import asyncio
+import json
+import mmap
+import os
+from bisect import bisect_right
+from typing import List, Optional, Dict
+from urllib.parse import quote
+
+from rf_event_listener.api import EventsApi, KvEntry, KvNotifyLast, KvPage, JsonLoads, default_json_loads
+
+
+class SegmentLog:
+    """
+    Local append-only log of raw kv entries, a directory of segment files per map and kv prefix.
+
+    Every line of a segment is `offset<TAB>entry json`, so the index of a segment is built
+    by scanning only offsets. Segments are read by memory mapping.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            segment_bytes: int = 64 * 1024 * 1024,
+            max_segments: Optional[int] = None,
+            json_loads: Optional[JsonLoads] = None,
+    ):
+        """
+        :param segment_bytes: a new segment is started when the current one reaches this size
+        :param max_segments: oldest segments of a map are deleted above this count, not limited by default
+        :param json_loads: decoder of entries, see default_json_loads
+        """
+        self._directory = directory
+        self._segment_bytes = segment_bytes
+        self._max_segments = max_segments
+        self._json_loads = json_loads or default_json_loads()
+        self._maps: Dict[str, MapLog] = {}
+
+    def map_log(self, map_id: str, kv_prefix: str) -> 'MapLog':
+        name = quote(f'{map_id}:{kv_prefix}', safe='')
+        log = self._maps.get(name, None)
+        if log is None:
+            log = self._maps[name] = MapLog(
+                os.path.join(self._directory, name), self._segment_bytes, self._max_segments, self._json_loads
+            )
+        return log
+
+    def close(self):
+        for log in self._maps.values():
+            log.close()
+        self._maps.clear()
+
+
+class MapLog:
+    """
+    Contiguous entries of one map, which follow the `start` offset, '' is the beginning of the map.
+    Entries are appended only after the last one, so there are no gaps.
+    Offsets are compared as strings, as millisecond timestamps of the same length.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int, max_segments: Optional[int], json_loads: JsonLoads):
+        self._directory = directory
+        self._segment_bytes = segment_bytes
+        self._max_segments = max_segments
+        self._json_loads = json_loads
+        os.makedirs(directory, exist_ok=True)
+
+        self._start_path = os.path.join(directory, 'start')
+        self.start: Optional[str] = None
+        if os.path.exists(self._start_path):
+            with open(self._start_path, encoding='utf-8') as f:
+                self.start = f.read()
+
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.log'))
+        self._segments = [_Segment(os.path.join(directory, name)) for name in names]
+        if self.start is None:
+            # the log was not started properly
+            for segment in self._segments:
+                segment.delete()
+            self._segments = []
+
+    @property
+    def last(self) -> Optional[str]:
+        """ Offset of the last entry, or start if the log has no entries """
+        for segment in reversed(self._segments):
+            if len(segment.offsets) != 0:
+                return segment.offsets[-1]
+        return self.start
+
+    def covers(self, offset: Optional[str]) -> bool:
+        """ Whether entries following the offset can be read from the log """
+        offset = offset or ''
+        last = self.last
+        return self.start is not None and self.start <= offset and last is not None and offset < last
+
+    def read(self, offset: Optional[str], limit: int) -> KvPage:
+        """ Up to `limit` entries following the offset """
+        offset = offset or ''
+        entries = []
+        raw_size = 0
+        for segment in self._segments:
+            if len(entries) >= limit:
+                break
+            if len(segment.offsets) == 0 or segment.offsets[-1] <= offset:
+                continue
+            for line in segment.read_lines(bisect_right(segment.offsets, offset), limit - len(entries)):
+                raw_size += len(line)
+                entries.append(KvEntry(**self._json_loads(line[line.index(b'\t') + 1:])))
+        return KvPage(entries, raw_size)
+
+    def append(self, offset: Optional[str], entries: List[KvEntry]):
+        """ Appends entries read after the offset, if they follow the last entry of the log """
+        offset = offset or ''
+        if self.start is None:
+            self._write_start(offset)
+        elif offset != self.last:
+            return
+
+        for entry in entries:
+            entry_offset = entry.key[-1]
+            if entry_offset <= offset:
+                continue
+            offset = entry_offset
+            if len(self._segments) == 0 or self._segments[-1].size >= self._segment_bytes:
+                self._roll()
+            line = f'{entry_offset}\t{json.dumps(entry.dict(), separators=(",", ":"))}\n'
+            self._segments[-1].append(entry_offset, line.encode())
+        if len(self._segments) != 0:
+            self._segments[-1].flush()
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+
+    def _roll(self):
+        if len(self._segments) != 0:
+            self._segments[-1].flush()
+        number = int(os.path.basename(self._segments[-1].path)[:-4]) + 1 if len(self._segments) != 0 else 0
+        self._segments.append(_Segment(os.path.join(self._directory, f'{number:012d}.log')))
+
+        if self._max_segments is not None and len(self._segments) > self._max_segments:
+            oldest = self._segments.pop(0)
+            # entries up to the end of the deleted segment are not in the log anymore
+            if len(oldest.offsets) != 0:
+                self._write_start(oldest.offsets[-1])
+            oldest.delete()
+
+    def _write_start(self, offset: str):
+        tmp_path = self._start_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(offset)
+        os.replace(tmp_path, self._start_path)
+        self.start = offset
+
+
+class _Segment:
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets: List[str] = []
+        self._positions: List[int] = []
+        self._mmap: Optional[mmap.mmap] = None
+
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        self._file = open(path, mode)
+        self.size = self._index()
+        self._file.seek(self.size)
+
+    def append(self, offset: str, line: bytes):
+        self.offsets.append(offset)
+        self._positions.append(self.size)
+        self._file.write(line)
+        self.size += len(line)
+
+    def flush(self):
+        self._file.flush()
+
+    def read_lines(self, start: int, limit: int) -> List[bytes]:
+        """ Lines of entries starting from the entry with `start` index """
+        end = min(start + limit, len(self.offsets))
+        if start >= end:
+            return []
+        data = self._mapped()
+        lines = []
+        for i in range(start, end):
+            line_end = self._positions[i + 1] if i + 1 < len(self._positions) else self.size
+            lines.append(data[self._positions[i]:line_end - 1])
+        return lines
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def delete(self):
+        self.close()
+        os.remove(self.path)
+
+    def _mapped(self) -> mmap.mmap:
+        if self._mmap is None or len(self._mmap) < self.size:
+            # the segment has grown since it was mapped
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), self.size, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _index(self) -> int:
+        """ Builds index of offsets, returns size of complete lines """
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        if size == 0:
+            return 0
+
+        with mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ) as data:
+            position = 0
+            while True:
+                line_end = data.find(b'\n', position)
+                if line_end == -1:
+                    break
+                tab = data.find(b'\t', position, line_end)
+                self.offsets.append(data[position:tab].decode())
+                self._positions.append(position)
+                position = line_end + 1
+
+        if position != size:
+            # a line torn by crash during write
+            self._file.truncate(position)
+        return position
+
+
+class ReplayEventsApi(EventsApi):
+    """
+    Serves get_map_notify from the local log when it has the requested entries,
+    fetches them from `api` otherwise, and appends them to the log if they follow its last entry.
+    A page, which reaches the end of the log, is filled up from `api`,
+    so the listener does not take it for the end of the map.
+    """
+
+    def __init__(self, api: EventsApi, log: SegmentLog):
+        self._api = api
+        self._log = log
+
+    async def get_map_notify_last(self, map_id: str, kv_prefix: str) -> KvNotifyLast:
+        return await self._api.get_map_notify_last(map_id, kv_prefix)
+
+    async def get_map_notify(self, map_id: str, kv_prefix: str, offset: Optional[str], limit: int) -> List[KvEntry]:
+        map_log = self._log.map_log(map_id, kv_prefix)
+        if not map_log.covers(offset):
+            return await self._fetch(map_log, map_id, kv_prefix, offset, limit)
+
+        page = map_log.read(offset, limit)
+        if len(page) >= limit:
+            return page
+        rest = await self._fetch(map_log, map_id, kv_prefix, page[-1].key[-1], limit - len(page))
+        return KvPage([*page, *rest], page.raw_size + getattr(rest, 'raw_size', 0))
+
+    async def _fetch(
+            self,
+            map_log: MapLog,
+            map_id: str,
+            kv_prefix: str,
+            offset: Optional[str],
+            limit: int,
+    ) -> List[KvEntry]:
+        entries = await self._api.get_map_notify(map_id, kv_prefix, offset, limit)
+        # writes to the disk, requests of a map are sequential, so the log is not read meanwhile
+        await asyncio.get_event_loop().run_in_executor(None, map_log.append, offset, entries)
+        return entries
+
+    async def wait_for_map_notify_last(self, map_id: str, kv_prefix: str, wait_version: str) -> Optional[KvNotifyLast]:
+        return await self._api.wait_for_map_notify_last(map_id, kv_prefix, wait_version)
+
+    async def close_session(self):
+        await self._api.close_session()
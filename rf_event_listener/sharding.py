@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import time
+from asyncio import CancelledError, Task
+from bisect import bisect_right
+from typing import Iterable, List, Dict, Optional, Tuple, Set
+
+from rf_event_listener.listener import MapsListener, EventConsumer
+
+logger = logging.getLogger('rf_maps_listener')
+
+
+def _hash(key: str) -> int:
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """ Consistent hashing, only maps of a joined or left node change their owner """
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 100):
+        """
+        :param replicas: points of every node on the ring, more points spread maps more evenly
+        """
+        points = sorted((_hash(f'{node}#{i}'), node) for node in set(nodes) for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if len(self._nodes) == 0:
+            return None
+        i = bisect_right(self._hashes, _hash(key))
+        return self._nodes[i % len(self._nodes)]
+
+
+class LeaseBackend:
+    """ Shared by all nodes, stores live nodes and leases of maps """
+
+    async def heartbeat(self, node_id: str, ttl: float):
+        """ Marks the node alive for `ttl` seconds """
+        raise NotImplementedError()
+
+    async def leave(self, node_id: str):
+        raise NotImplementedError()
+
+    async def live_nodes(self) -> List[str]:
+        raise NotImplementedError()
+
+    async def acquire(self, map_id: str, node_id: str, ttl: float) -> bool:
+        """ Acquires or renews lease of the map for `ttl` seconds, fails while another node holds it """
+        raise NotImplementedError()
+
+    async def release(self, map_id: str, node_id: str):
+        raise NotImplementedError()
+
+
+class SqliteLeaseBackend(LeaseBackend):
+    """ Leases in a SQLite database, for nodes on one host and for tests """
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, expires_at REAL)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS leases (map_id TEXT PRIMARY KEY, node_id TEXT, expires_at REAL)'
+        )
+
+    async def heartbeat(self, node_id: str, ttl: float):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO nodes (node_id, expires_at) VALUES (?, ?)', (node_id, time.time() + ttl)
+        )
+
+    async def leave(self, node_id: str):
+        self._connection.execute('DELETE FROM nodes WHERE node_id = ?', (node_id,))
+
+    async def live_nodes(self) -> List[str]:
+        rows = self._connection.execute('SELECT node_id FROM nodes WHERE expires_at > ?', (time.time(),))
+        return [node_id for node_id, in rows]
+
+    async def acquire(self, map_id: str, node_id: str, ttl: float) -> bool:
+        now = time.time()
+        # write lock for the whole check and update
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._connection.execute('SELECT node_id, expires_at FROM leases WHERE map_id = ?', (map_id,))
+            row = row.fetchone()
+            if row is not None and row[0] != node_id and row[1] > now:
+                return False
+            self._connection.execute(
+                'INSERT OR REPLACE INTO leases (map_id, node_id, expires_at) VALUES (?, ?, ?)',
+                (map_id, node_id, now + ttl),
+            )
+            return True
+        finally:
+            self._connection.execute('COMMIT')
+
+    async def release(self, map_id: str, node_id: str):
+        self._connection.execute('DELETE FROM leases WHERE map_id = ? AND node_id = ?', (map_id, node_id))
+
+    def close(self):
+        self._connection.close()
+
+
+class ShardedMapsListener:
+    """
+    Every replica adds all maps, but listens only to maps, which it owns on the hash ring of live nodes.
+    A map is listened to only while its lease is held, so a map moves to its new owner
+    after the previous owner has stopped listening to it, or after its lease has expired.
+
+    Offsets should be shared by the nodes, e.g. with MapsListener(offset_store=...) in a shared storage,
+    so the new owner continues from the last committed offset, see OffsetStore.load_committed.
+    """
+
+    def __init__(
+            self,
+            listener: MapsListener,
+            backend: LeaseBackend,
+            node_id: str,
+            lease_ttl: float = 30,
+            renew_interval: float = 10,
+            replicas: int = 100,
+    ):
+        """
+        :param lease_ttl: seconds, after which maps of a failed node are taken over by other nodes
+        :param renew_interval: seconds between renewals of leases and rebalancing, less than lease_ttl
+        :param replicas: see HashRing
+        """
+        self._listener = listener
+        self._backend = backend
+        self._node_id = node_id
+        self._lease_ttl = lease_ttl
+        self._renew_interval = renew_interval
+        self._replicas = replicas
+        self._maps: Dict[str, Tuple[str, EventConsumer, Optional[str]]] = {}
+        # map id -> monotonic time, when its lease expires
+        self._owned: Dict[str, float] = {}
+        # maps once listened to by this node, they are not rewound to their initial offset again
+        self._acquired: Set[str] = set()
+        self._task: Optional[Task] = None
+
+    @property
+    def owned_maps(self) -> Set[str]:
+        return set(self._owned)
+
+    def add_map(self, map_id: str, kv_prefix: str, consumer: EventConsumer, initial_offset: Optional[str] = None):
+        """
+        Map is listened to when this node owns it, from the committed offset,
+        or from the initial offset on its first acquisition, when nothing is committed yet
+        """
+        self._maps[map_id] = (kv_prefix, consumer, initial_offset)
+
+    async def remove_map(self, map_id: str):
+        self._maps.pop(map_id, None)
+        self._acquired.discard(map_id)
+        if map_id in self._owned:
+            await self._stop_map(map_id)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """ Stops listening and releases leases, so other nodes take the maps over at once """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except CancelledError:
+                pass
+            self._task = None
+        for map_id in list(self._owned):
+            await self._stop_map(map_id)
+        await self._backend.leave(self._node_id)
+
+    async def rebalance(self):
+        """ Renews leases, starts maps owned by this node and stops the others """
+        started = time.monotonic()
+        await self._backend.heartbeat(self._node_id, self._lease_ttl)
+        ring = HashRing(await self._backend.live_nodes(), self._replicas)
+
+        for map_id in list(self._owned):
+            if map_id not in self._maps or ring.owner(map_id) != self._node_id:
+                await self._stop_map(map_id)
+
+        for map_id, (kv_prefix, consumer, initial_offset) in self._maps.items():
+            if ring.owner(map_id) != self._node_id:
+                continue
+            if not await self._backend.acquire(map_id, self._node_id, self._lease_ttl):
+                if map_id in self._owned:
+                    # another node holds the lease, it is not ours to release
+                    logger.warning(f'[{map_id}] Lease of the map was taken over')
+                    await self._stop_map(map_id, release=False)
+                # otherwise the previous owner has not released it yet
+                continue
+            if map_id not in self._owned:
+                logger.info(f'[{map_id}] Map is owned by node {self._node_id}')
+                offset = await self._listener.committed_offset(map_id)
+                if offset is None and map_id not in self._acquired:
+                    offset = initial_offset
+                self._listener.add_map(map_id, kv_prefix, consumer, offset)
+                self._acquired.add(map_id)
+            self._owned[map_id] = started + self._lease_ttl
+
+        self._stop_expired()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebalance()
+            except CancelledError:
+                raise
+            except Exception:
+                logger.exception(f'Error in rebalancing of node {self._node_id}')
+                self._stop_expired()
+            await asyncio.sleep(self._renew_interval)
+
+    def _stop_expired(self):
+        # leases could not be renewed, so other nodes may own the maps already
+        now = time.monotonic()
+        for map_id, expires_at in list(self._owned.items()):
+            if expires_at <= now:
+                logger.warning(f'[{map_id}] Lease of the map expired')
+                self._listener.remove_map(map_id)
+                del self._owned[map_id]
+
+    async def _stop_map(self, map_id: str, release: bool = True):
+        logger.info(f'[{map_id}] Map is not owned by node {self._node_id} anymore')
+        task = self._listener.remove_map(map_id)
+        del self._owned[map_id]
+        if task is not None:
+            # offsets are committed before the lease is released
+            try:
+                await task
+            except CancelledError:
+                pass
+        # and written, so the next owner reads them
+        await self._listener.flush_offsets()
+        if release:
+            await self._backend.release(map_id, self._node_id)
@@ -0,0 +1,68 @@
+import asyncio
+import heapq
+import itertools
+import time
+from asyncio import CancelledError, Future, Task
+from typing import Callable, Optional, List, Tuple, Any
+
+# sort key of a map by its id and initial offset, maps with lower keys start first
+StartupPriority = Callable[[str, Optional[str]], Any]
+
+
+def oldest_offset_first(map_id: str, offset: Optional[str]) -> Any:
+    # maps without offset start from the latest event, so they have no backlog to catch up
+    return (offset is None, offset or '')
+
+
+class StartupScheduler:
+    """
+    Ramps up starting map listeners, so their first requests do not flood the API.
+    `burst` maps start at once, then `rate` maps per second, in order of `priority`.
+    """
+
+    def __init__(self, rate: float = 50, burst: int = 10, priority: StartupPriority = oldest_offset_first):
+        self._rate = rate
+        self._burst = burst
+        self._priority = priority
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._waiting: List[Tuple[Any, int, Future]] = []
+        self._counter = itertools.count()
+        self._pump: Optional[Task] = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiting if not future.done())
+
+    async def admit(self, map_id: str, offset: Optional[str]):
+        """ Waits for the turn of the map to start """
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiting, (self._priority(map_id, offset), next(self._counter), future))
+        if self._pump is None:
+            # started on the next iteration of the loop, so maps added at once are ordered by priority
+            self._pump = asyncio.ensure_future(self._release())
+        try:
+            await future
+        except CancelledError:
+            # skipped by _release
+            future.cancel()
+            raise
+
+    async def _release(self):
+        try:
+            while len(self._waiting) != 0:
+                self._refill()
+                while self._tokens >= 1 and len(self._waiting) != 0:
+                    _, _, future = heapq.heappop(self._waiting)
+                    if not future.done():
+                        future.set_result(None)
+                        self._tokens -= 1
+                if len(self._waiting) != 0:
+                    await asyncio.sleep((1 - self._tokens) / self._rate)
+        finally:
+            self._pump = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(float(self._burst), self._tokens + (now - self._refilled_at) * self._rate)
+        self._refilled_at = now
@@ -0,0 +1,106 @@
+import re
+from typing import List
+
+_STRUCTURAL = re.compile(rb'[\[\]{},"]')
+_STRING_SPECIAL = re.compile(rb'["\\]')
+
+
+class JsonArraySplitter:
+    """
+    Splits JSON array, which arrives in chunks, into raw JSON of its items.
+    Only the unfinished item is buffered, so memory is bounded by the largest item.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._item_start = 0
+        self._item_count = 0
+        self._finished = False
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """ Returns raw items completed by this chunk """
+        if self._finished:
+            if chunk.strip():
+                raise ValueError('Unexpected data after the end of JSON array')
+            return []
+
+        self._buffer += chunk
+        items = []
+        buffer = self._buffer
+
+        while True:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(buffer, self._pos)
+                if match is None:
+                    self._pos = len(buffer)
+                    break
+                if match.group() == b'\\':
+                    if match.end() == len(buffer):
+                        # escaped char is in the next chunk
+                        self._pos = match.start()
+                        break
+                    self._pos = match.end() + 1
+                    continue
+                self._in_string = False
+                self._pos = match.end()
+                continue
+
+            match = _STRUCTURAL.search(buffer, self._pos)
+            if match is None:
+                self._pos = len(buffer)
+                break
+            char = match.group()
+            self._pos = match.end()
+
+            if self._depth == 0:
+                if char != b'[' or buffer[:match.start()].strip():
+                    raise ValueError('JSON array expected')
+                self._depth = 1
+                self._item_start = self._pos
+            elif char == b'"':
+                self._in_string = True
+            elif char in b'[{':
+                self._depth += 1
+            elif self._depth > 1:
+                if char in b']}':
+                    self._depth -= 1
+            elif char == b',':
+                items.append(self._take_item(match.start(), required=True))
+            elif char == b']':
+                item = self._take_item(match.start(), required=self._item_count != 0)
+                if item:
+                    items.append(item)
+                self._finished = True
+                if buffer[self._pos:].strip():
+                    raise ValueError('Unexpected data after the end of JSON array')
+                break
+            else:
+                raise ValueError(f'Unexpected {char!r} in JSON array')
+
+        self._compact()
+        return items
+
+    def close(self):
+        """ Checks that the whole array was received """
+        if not self._finished:
+            raise ValueError('JSON array is incomplete')
+
+    def _take_item(self, end: int, required: bool) -> bytes:
+        item = bytes(self._buffer[self._item_start:end]).strip()
+        if required and not item:
+            raise ValueError('Empty item in JSON array')
+        self._item_start = end + 1
+        if item:
+            self._item_count += 1
+        return item
+
+    def _compact(self):
+        # drop consumed items, so the buffer holds only the current item
+        start = min(self._item_start, self._pos)
+        if start > 0:
+            del self._buffer[:start]
+            self._pos -= start
+            self._item_start -= start
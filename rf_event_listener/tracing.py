@@ -0,0 +1,100 @@
+import logging
+import time
+from enum import Enum
+from typing import Any, Optional, Sequence, Tuple, List
+
+logger = logging.getLogger('rf_maps_listener')
+
+
+class TraceStage(str, Enum):
+    get_map_notify = 'get_map_notify'
+    wait_for_map_notify_last = 'wait_for_map_notify_last'
+    parse = 'parse'
+    consume = 'consume'
+    commit = 'commit'
+
+
+class TraceHook:
+    """
+    Called at start and end of every stage of map listeners, e.g. to create spans of a tracer.
+
+    Offset is the `from` offset of get_map_notify, the last entry of the page for parse,
+    the consumed entry, or the last entry of the batch, for consume, and the committed offset for commit.
+    It is None for wait_for_map_notify_last.
+    """
+
+    def on_start(self, stage: TraceStage, map_id: str, offset: Optional[str]) -> Any:
+        """ Returns context passed to on_end of the same stage """
+        return None
+
+    def on_end(
+            self,
+            stage: TraceStage,
+            map_id: str,
+            offset: Optional[str],
+            seconds: float,
+            context: Any,
+            error: Optional[BaseException],
+    ):
+        pass
+
+
+class Tracer:
+    """ Hooks of MapsListener, shared by its map listeners """
+
+    def __init__(self, hooks: Sequence[TraceHook] = ()):
+        self.hooks: Tuple[TraceHook, ...] = tuple(hooks)
+
+    def add_hook(self, hook: TraceHook):
+        self.hooks = (*self.hooks, hook)
+
+    def remove_hook(self, hook: TraceHook):
+        self.hooks = tuple(h for h in self.hooks if h is not hook)
+
+    def span(self, stage: TraceStage, map_id: str, offset: Optional[str] = None) -> '_Span':
+        """ Context manager around a stage, a shared no-op one when there are no hooks """
+        if len(self.hooks) == 0:
+            return _NO_SPAN
+        return _Span(self.hooks, stage, map_id, offset)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class _Span(_NoSpan):
+    __slots__ = ('_hooks', '_stage', '_map_id', '_offset', '_started', '_contexts')
+
+    def __init__(self, hooks: Tuple[TraceHook, ...], stage: TraceStage, map_id: str, offset: Optional[str]):
+        self._hooks = hooks
+        self._stage = stage
+        self._map_id = map_id
+        self._offset = offset
+        self._started = 0.0
+        self._contexts: List[Any] = []
+
+    def __enter__(self):
+        for hook in self._hooks:
+            try:
+                self._contexts.append(hook.on_start(self._stage, self._map_id, self._offset))
+            except Exception:
+                logger.exception(f"[{self._map_id}] Error in trace hook")
+                self._contexts.append(None)
+        self._started = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        seconds = time.perf_counter() - self._started
+        for hook, context in zip(self._hooks, self._contexts):
+            try:
+                hook.on_end(self._stage, self._map_id, self._offset, seconds, context, exc_val)
+            except Exception:
+                logger.exception(f"[{self._map_id}] Error in trace hook")
+
+
+_NO_SPAN = _NoSpan()
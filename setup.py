@@ -31,6 +31,9 @@ setup(
             'pytest-asyncio ~= 0.12',
             'flake8 ~= 3.8',
         ],
+        'fast-json': [
+            'orjson >= 3.0',
+        ],
     },
     include_package_data=True,
     zip_safe=False
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+from aiohttp import web
+from yarl import URL
+
+from rf_event_listener.api import HttpEventsApi, ConnectionPoolConfig, KvNotifyLast, KvEntry, create_session
+
+
+NOTIFY_BODY = [
+    {'key': ['mapNotif', '0'], 'value': {'type': 'node_updated'}},
+    {'key': ['mapNotif', '1'], 'value': {'type': 'node_deleted'}},
+]
+
+
+class MockServer:
+    def __init__(self):
+        self.requests = []
+        app = web.Application()
+        app.router.add_get('/kv/keys/{key}', self._notify_last)
+        app.router.add_get('/kv/partition/{key}', self._notify)
+        self._runner = web.AppRunner(app)
+        self.url = None
+
+    async def __aenter__(self) -> 'MockServer':
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = URL(f'http://127.0.0.1:{port}')
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._runner.cleanup()
+
+    async def _notify_last(self, request: web.Request):
+        self.requests.append(request.rel_url)
+        if 'waitVersion' in request.query:
+            raise web.HTTPRequestTimeout()
+        return web.json_response({'value': '1', 'version': '2'})
+
+    async def _notify(self, request: web.Request):
+        self.requests.append(request.rel_url)
+        # small chunks to test incremental parsing
+        resp = web.StreamResponse()
+        resp.enable_chunked_encoding()
+        await resp.prepare(request)
+        body = json.dumps(NOTIFY_BODY).encode()
+        for i in range(0, len(body), 10):
+            await resp.write(body[i:i + 10])
+        await resp.write_eof()
+        return resp
+
+
+@pytest.mark.asyncio
+async def test_http_events_api():
+    async with MockServer() as server:
+        async with HttpEventsApi(server.url, pool=ConnectionPoolConfig(limit=2)) as api:
+            assert await api.get_map_notify_last('map', 'prefix') == KvNotifyLast(value='1', version='2')
+            page = await api.get_map_notify('map', 'prefix', '0', 10)
+            assert page == [
+                KvEntry(key=['mapNotif', '0'], value={'type': 'node_updated'}),
+                KvEntry(key=['mapNotif', '1'], value={'type': 'node_deleted'}),
+            ]
+            assert page.raw_size == len(json.dumps(NOTIFY_BODY))
+            assert await api.wait_for_map_notify_last('map', 'prefix', '2') is None
+
+        assert server.requests[1].query['from'] == '0'
+        assert server.requests[1].query['limit'] == '10'
+
+
+@pytest.mark.asyncio
+async def test_iter_map_notify():
+    async with MockServer() as server:
+        async with HttpEventsApi(server.url) as api:
+            entries = [e async for e in api.iter_map_notify('map', 'prefix', None, 10)]
+
+    assert entries == [KvEntry(**e) for e in NOTIFY_BODY]
+
+
+@pytest.mark.asyncio
+async def test_shared_session_is_not_closed():
+    async with MockServer() as server:
+        session = create_session(pool=ConnectionPoolConfig.for_maps(10))
+        async with HttpEventsApi(server.url, session=session) as api:
+            await api.get_map_notify_last('map', 'prefix')
+        async with HttpEventsApi(server.url, session=session) as api:
+            await api.get_map_notify_last('map', 'prefix')
+
+        assert not session.closed
+        await session.close()
+
+
+@pytest.mark.asyncio
+async def test_custom_json_loads():
+    decoded = []
+
+    def loads(body: bytes):
+        decoded.append(body)
+        return json.loads(body)
+
+    async with MockServer() as server:
+        async with HttpEventsApi(server.url, json_loads=loads) as api:
+            assert await api.get_map_notify_last('map', 'prefix') == KvNotifyLast(value='1', version='2')
+
+    assert len(decoded) == 1
+    assert isinstance(decoded[0], bytes)
+
+
+def test_pool_size_for_maps():
+    assert ConnectionPoolConfig.for_maps(1000).limit == 1010
+    assert ConnectionPoolConfig.for_maps(1000, max_concurrent_waits=100, extra_connections=20).limit == 120
+    assert ConnectionPoolConfig.for_maps(50, max_concurrent_waits=100, limit_per_host=30).limit_per_host == 30
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from rf_event_listener.buffer import BufferLimits, PageBuffer
+
+
+@pytest.mark.asyncio
+async def test_fetch_pauses_between_watermarks():
+    buffer = PageBuffer(BufferLimits(high_events=10, low_events=4))
+
+    await buffer.put('a', 6)
+    await buffer.put('b', 6)
+    assert buffer.stats()['events'] == 12
+
+    put = asyncio.ensure_future(buffer.put('c', 1))
+    await asyncio.sleep(0)
+    assert not put.done()
+    assert buffer.stats()['fetch_paused']
+
+    # 6 events left, still above the low watermark
+    assert await buffer.get() == 'a'
+    await asyncio.sleep(0)
+    assert not put.done()
+
+    assert await buffer.get() == 'b'
+    await asyncio.wait_for(put, 1)
+    assert await buffer.get() == 'c'
+
+    stats = buffer.stats()
+    assert stats['pages'] == 0
+    assert stats['blocked_count'] == 1
+    assert stats['blocked_seconds'] > 0
+    assert not stats['fetch_paused']
+
+
+@pytest.mark.asyncio
+async def test_byte_watermarks():
+    buffer = PageBuffer(BufferLimits(high_events=1000, high_bytes=100))
+
+    await buffer.put('a', 1, 150)
+    put = asyncio.ensure_future(buffer.put('b', 1, 10))
+    await asyncio.sleep(0)
+    assert not put.done()
+    assert buffer.stats()['bytes'] == 150
+
+    assert await buffer.get() == 'a'
+    await asyncio.wait_for(put, 1)
+    assert buffer.stats()['bytes'] == 10
+
+
+@pytest.mark.asyncio
+async def test_max_pages_and_get_waits_for_put():
+    buffer = PageBuffer(max_pages=1)
+
+    get = asyncio.ensure_future(buffer.get())
+    await asyncio.sleep(0)
+    assert not get.done()
+
+    await buffer.put('a', 1000)
+    assert await asyncio.wait_for(get, 1) == 'a'
+
+    await buffer.put('b', 1)
+    put = asyncio.ensure_future(buffer.put('c', 1))
+    await asyncio.sleep(0)
+    assert not put.done()
+    assert await buffer.get() == 'b'
+    await asyncio.wait_for(put, 1)
@@ -0,0 +1,15 @@
+from rf_event_listener.dedupe import RecentOffsets
+
+
+def test_recent_offsets_window():
+    recent = RecentOffsets(3, ['1', '2'])
+    assert '1' in recent
+    assert '3' not in recent
+
+    recent.add('3')
+    recent.add('3')
+    recent.add('4')
+    # the oldest offset is evicted
+    assert '1' not in recent
+    assert recent.offsets() == ['2', '3', '4']
+    assert len(recent) == 3
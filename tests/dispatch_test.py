@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from datetime import datetime
+
+from rf_event_listener.dispatch import ConcurrentDispatcher
+from rf_event_listener.events import NodeUpdatedMapEvent, EventType, MapEventUser
+
+
+def entry(offset: str, node_id: str):
+    event = NodeUpdatedMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what=node_id,
+    )
+    return offset, [(datetime.utcfromtimestamp(0), event)]
+
+
+@pytest.mark.asyncio
+async def test_keeps_order_per_node():
+    entries = [entry('0', 'a'), entry('1', 'b'), entry('2', 'a'), entry('3', 'b'), entry('4', 'a')]
+    consumed = []
+    running = 0
+    max_running = 0
+
+    async def consume(offset, events):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        # node 'a' is slow
+        await asyncio.sleep(0.01 if events[0][1].what == 'a' else 0)
+        consumed.append(events[0][1].what)
+        running -= 1
+
+    progress = []
+
+    async def on_progress(offset: str, count: int, completed: bool):
+        progress.append((offset, count, completed))
+
+    await ConcurrentDispatcher(workers=4).dispatch(entries, consume, on_progress)
+
+    assert consumed == ['b', 'b', 'a', 'a', 'a']
+    assert max_running == 2
+    # entry '1' of node 'b' is consumed first, but it is committed only after entry '0'
+    assert progress[0][0] == '1'
+    assert progress[-1] == ('4', progress[-1][1], True)
+    assert sum(count for _, count, _ in progress) == 5
+    assert [offset for offset, _, _ in progress] == sorted(offset for offset, _, _ in progress)
+
+
+@pytest.mark.asyncio
+async def test_limits_workers():
+    entries = [entry(str(i), f'node-{i}') for i in range(10)]
+    running = 0
+    max_running = 0
+
+    async def consume(offset, events):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+
+    async def on_progress(offset: str, count: int, completed: bool):
+        pass
+
+    await ConcurrentDispatcher(workers=3).dispatch(entries, consume, on_progress)
+
+    assert max_running == 3
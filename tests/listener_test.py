@@ -1,13 +1,24 @@
 import asyncio
 import pytest
+import shutil
 from asyncio import Future, wait_for
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, List, Tuple
 
 from rf_event_listener.api import EventsApi, KvNotifyLast, KvEntry
+from rf_event_listener.buffer import BufferLimits
+from rf_event_listener.commit import CommitEachEvent, CommitEachPage, CommitEveryEvents, CommitEveryInterval
+from rf_event_listener.dispatch import ConcurrentDispatcher
 from rf_event_listener.events import TypedMapEvent, CompoundMapEvent, EventType, MapEventUser, NodeUpdatedMapEvent, \
     NodeDeletedMapEvent, any_event_to_typed
-from rf_event_listener.listener import MapsListener, process_event, EventConsumer
+from rf_event_listener.metrics import MetricsRegistry
+from rf_event_listener.offsets import FileOffsetStore
+from rf_event_listener.listener import MapsListener, process_event, EventConsumer, MapSpec, SetMapsReport
+from rf_event_listener.paging import AdaptivePageSizer, PageSizer
+from rf_event_listener.retry import ExponentialBackoff
+from rf_event_listener.startup import StartupScheduler
+from rf_event_listener.tracing import TraceHook
 
 
 class MockEventsApi(EventsApi):
@@ -285,6 +296,774 @@ async def test_close_event_consumer():
     await wait_for(completed, 10)
 
 
+@pytest.mark.asyncio
+async def test_close_event_consumer_after_failed_commit():
+    closed: Future[None] = Future()
+
+    class FailingConsumer(EventConsumer):
+        async def commit(self, offset: str):
+            raise RuntimeError()
+
+        async def close(self):
+            closed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = MockEventsApi(
+        events=[KvEntry(key=['0'], value=event)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    listener = MapsListener(api, backoff=ExponentialBackoff(initial_delay=10, jitter=0))
+    listener.add_map('map-id', 'map-prefix', FailingConsumer(), '-1')
+    await asyncio.sleep(0.01)
+
+    # the final commit fails again
+    task = listener.remove_map('map-id')
+    await asyncio.wait([task])
+    await wait_for(closed, 10)
+
+
+@pytest.mark.asyncio
+async def test_prefetch_next_page_while_consuming():
+    second_page_requested: Future[None] = Future()
+    completed: Future[None] = Future()
+    consumed = []
+
+    class PrefetchApi(MockEventsApi):
+        async def get_map_notify(self, map_id: str, kv_prefix: str, offset: Optional[str], limit: int):
+            if offset == '1' and not second_page_requested.done():
+                second_page_requested.set_result(None)
+            return await super().get_map_notify(map_id, kv_prefix, offset, limit)
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            # first page is blocked until the second one is requested
+            await second_page_requested
+            consumed.append(event.what)
+            if len(consumed) == 4:
+                completed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = PrefetchApi(
+        events=[KvEntry(key=[str(i)], value=event) for i in range(4)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    listener = MapsListener(api, events_per_request=2, prefetch_pages=1)
+    listener.add_map('map-id', 'map-prefix', Consumer(), '-1')
+
+    await wait_for(completed, 10)
+    assert consumed == ['node-id'] * 4
+    listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_buffer_pauses_fetching_while_consumer_is_behind():
+    release: Future[None] = Future()
+    completed: Future[None] = Future()
+    consumed = []
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            await release
+            consumed.append(event.what)
+            if len(consumed) == 10:
+                completed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = MockEventsApi(
+        events=[KvEntry(key=[str(i)], value=event) for i in range(10)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    listener = MapsListener(api, events_per_request=2, buffer_limits=BufferLimits(high_events=4, low_events=2))
+    listener.add_map('map-id', 'map-prefix', Consumer(), '-1')
+
+    async def fetch_paused():
+        while not (listener.buffer_stats('map-id') or {}).get('fetch_paused'):
+            await asyncio.sleep(0.001)
+
+    await wait_for(fetch_paused(), 10)
+    # first page is being consumed, two more are buffered
+    stats = listener.buffer_stats('map-id')
+    assert stats['pages'] == 2
+    assert stats['events'] == 4
+
+    release.set_result(None)
+    await wait_for(completed, 10)
+    assert listener.buffer_stats('map-id')['blocked_count'] >= 1
+    listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_batch_consumer_commits_once_per_page():
+    completed: Future[None] = Future()
+    batches = []
+    commits = []
+
+    class BatchConsumer(EventConsumer):
+        async def consume_batch(self, events: List[Tuple[datetime, TypedMapEvent]]):
+            batches.append([event.what for _, event in events])
+
+        async def commit(self, offset: str):
+            commits.append(offset)
+            if offset == '4':
+                completed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = MockEventsApi(
+        events=[KvEntry(key=[str(i)], value=event) for i in range(5)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    listener = MapsListener(api, events_per_request=3)
+    listener.add_map('map-id', 'map-prefix', BatchConsumer(), '-1')
+
+    await wait_for(completed, 10)
+    assert batches == [['node-id'] * 3, ['node-id'] * 2]
+    assert commits == ['2', '4']
+    listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_commit_every_events_flushes_when_drained():
+    completed: Future[None] = Future()
+    commits = []
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            pass
+
+        async def commit(self, offset: str):
+            commits.append(offset)
+            if offset == '4':
+                completed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = MockEventsApi(
+        events=[KvEntry(key=[str(i)], value=event) for i in range(5)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    listener = MapsListener(api, events_per_request=10, commit_policy=CommitEveryEvents(2))
+    listener.add_map('map-id', 'map-prefix', Consumer(), '-1')
+
+    await wait_for(completed, 10)
+    assert commits == ['1', '3', '4']
+    listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_stream_pages():
+    completed: Future[None] = Future()
+    commits = []
+    fetch_seconds = []
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            await asyncio.sleep(0.02)
+
+        async def commit(self, offset: str):
+            commits.append(offset)
+            if offset == '4':
+                completed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = MockEventsApi(
+        events=[KvEntry(key=[str(i)], value=event) for i in range(5)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+
+    class RecordingPageSizer(PageSizer):
+        def observe_fetch(self, requested: int, received: int, seconds: float):
+            fetch_seconds.append(seconds)
+
+    listener = MapsListener(
+        api,
+        events_per_request=3,
+        commit_policy=CommitEachPage(),
+        stream_pages=True,
+        page_sizer_factory=lambda: RecordingPageSizer(3),
+    )
+    listener.add_map('map-id', 'map-prefix', Consumer(), '-1')
+
+    await wait_for(completed, 10)
+    assert commits == ['2', '4']
+    # consumption of streamed events is not a part of the fetch
+    assert max(fetch_seconds) < 0.02
+    listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_adaptive_page_size():
+    completed: Future[None] = Future()
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            pass
+
+        async def commit(self, offset: str):
+            if offset == '9':
+                completed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = MockEventsApi(
+        events=[KvEntry(key=[str(i)], value=event) for i in range(10)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    listener = MapsListener(
+        api,
+        page_sizer_factory=lambda: AdaptivePageSizer(initial_size=2, min_size=2, max_size=8),
+    )
+    listener.add_map('map-id', 'map-prefix', Consumer(), '-1')
+
+    await wait_for(completed, 10)
+    # full pages of 2 and 4 events, then 4 events of 8
+    assert listener.page_size('map-id') == 4
+    assert listener.page_size('unknown-map-id') is None
+    listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_retry_after_error():
+    completed: Future[TypedMapEvent] = Future()
+
+    class FailingApi(MockEventsApi):
+        failed = False
+
+        async def get_map_notify(self, map_id: str, kv_prefix: str, offset: Optional[str], limit: int):
+            if not self.failed:
+                self.failed = True
+                raise RuntimeError('transient error')
+            return await super().get_map_notify(map_id, kv_prefix, offset, limit)
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            completed.set_result(event)
+
+    event = NodeUpdatedMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    )
+
+    api = FailingApi(
+        events=[KvEntry(key=['0'], value=event.dict())],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    listener = MapsListener(api, backoff=ExponentialBackoff(initial_delay=0.01))
+    listener.add_map('map-id', 'map-prefix', Consumer(), '-1')
+
+    assert await wait_for(completed, 10) == event
+    listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_concurrent_dispatch_commits_watermark():
+    completed: Future[None] = Future()
+    consumed = []
+    commits = []
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            if event.what == 'slow':
+                await asyncio.sleep(0.01)
+            consumed.append(event.what)
+
+        async def commit(self, offset: str):
+            commits.append(offset)
+            if offset == '2':
+                completed.set_result(None)
+
+    def event(node_id: str):
+        return CompoundMapEvent(
+            type=EventType.node_updated,
+            who=MapEventUser(
+                id='user-id',
+                username='user@test',
+            ),
+            what=node_id,
+        ).dict()
+
+    api = MockEventsApi(
+        events=[
+            KvEntry(key=['0'], value=event('slow')),
+            KvEntry(key=['1'], value=event('fast')),
+            KvEntry(key=['2'], value=event('fast')),
+        ],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    listener = MapsListener(api, dispatcher=ConcurrentDispatcher(workers=2))
+    listener.add_map('map-id', 'map-prefix', Consumer(), '-1')
+
+    await wait_for(completed, 10)
+    assert consumed == ['fast', 'fast', 'slow']
+    assert commits == ['2']
+    listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_parse_page_in_executor():
+    completed: Future[None] = Future()
+    consumed = []
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            consumed.append(event.what)
+
+        async def commit(self, offset: str):
+            if offset == '2':
+                completed.set_result(None)
+
+    def event(node_id: str):
+        return CompoundMapEvent(
+            type=EventType.node_updated,
+            who=MapEventUser(
+                id='user-id',
+                username='user@test',
+            ),
+            what=node_id,
+        ).dict()
+
+    api = MockEventsApi(
+        events=[KvEntry(key=[str(i)], value=event(f'node-{i}')) for i in range(3)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        listener = MapsListener(api, parse_executor=executor, parse_offload_threshold=2)
+        listener.add_map('map-id', 'map-prefix', Consumer(), '-1')
+
+        await wait_for(completed, 10)
+        assert consumed == ['node-0', 'node-1', 'node-2']
+        listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_metrics():
+    completed: Future[None] = Future()
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            pass
+
+        async def commit(self, offset: str):
+            if offset == '2000':
+                completed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = MockEventsApi(
+        events=[KvEntry(key=[str(i * 1000)], value=event) for i in range(3)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    metrics = MetricsRegistry()
+    listener = MapsListener(api, events_per_request=2, commit_policy=CommitEachPage(), metrics=metrics)
+    listener.add_map('map-id', 'map-prefix', Consumer(), '-1')
+
+    await wait_for(completed, 10)
+    # the map is caught up after the commit
+    await asyncio.sleep(0)
+    snapshot = metrics.snapshot()['maps']['map-id']
+    assert snapshot['events'] == 3
+    assert snapshot['pages'] == 2
+    assert snapshot['committed_offset'] == '2000'
+    assert snapshot['lag_seconds'] == 0
+    assert snapshot['consume_seconds']['node_updated']['count'] == 3
+    assert snapshot['request_seconds']['get_map_notify']['count'] == 2
+
+    listener.remove_map('map-id')
+    assert metrics.snapshot()['maps'] == {}
+
+
+@pytest.mark.asyncio
+async def test_trace_hooks():
+    completed: Future[None] = Future()
+    stages = []
+
+    class Hook(TraceHook):
+        def on_end(self, stage, map_id, offset, seconds, context, error):
+            stages.append((stage.value, offset))
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            pass
+
+        async def commit(self, offset: str):
+            if offset == '1':
+                completed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = MockEventsApi(
+        events=[KvEntry(key=[str(i)], value=event) for i in range(2)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    listener = MapsListener(api, commit_policy=CommitEachPage())
+    listener.add_trace_hook(Hook())
+    listener.add_map('map-id', 'map-prefix', Consumer(), '-1')
+
+    await wait_for(completed, 10)
+    # the commit span ends after the consumer has committed
+    await asyncio.sleep(0)
+    assert stages == [
+        ('get_map_notify', '-1'),
+        ('parse', '1'),
+        ('consume', '0'),
+        ('consume', '1'),
+        ('commit', '1'),
+    ]
+    listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_event_type_filter_commits_skipped_entries():
+    completed: Future[None] = Future()
+    consumed = []
+    commits = []
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            consumed.append(event.what)
+
+        async def commit(self, offset: str):
+            commits.append(offset)
+            if offset == '2':
+                completed.set_result(None)
+
+    def event(event_type: EventType, node_id: str):
+        return CompoundMapEvent(
+            type=event_type,
+            who=MapEventUser(
+                id='user-id',
+                username='user@test',
+            ),
+            what=node_id,
+        ).dict()
+
+    api = MockEventsApi(
+        events=[
+            KvEntry(key=['0'], value=event(EventType.node_updated, 'updated')),
+            KvEntry(key=['1'], value=event(EventType.node_deleted, 'deleted')),
+            KvEntry(key=['2'], value=event(EventType.node_updated, 'updated')),
+        ],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    listener = MapsListener(api, event_types={EventType.node_updated})
+    listener.add_map('map-id', 'map-prefix', Consumer(), '-1', event_types={EventType.node_deleted})
+
+    await wait_for(completed, 10)
+    assert consumed == ['deleted']
+    assert commits == ['0', '1', '2']
+    listener.remove_map('map-id')
+
+
+@pytest.mark.asyncio
+async def test_offset_store(tmp_path):
+    completed: Future[None] = Future()
+    consumed = []
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            consumed.append(event.what)
+
+        async def commit(self, offset: str):
+            if offset == '2':
+                completed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = MockEventsApi(
+        events=[KvEntry(key=[str(i)], value=event) for i in range(3)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    path = str(tmp_path / 'offsets.log')
+    store = FileOffsetStore(path)
+    await store.commit('map-id', '0')
+    listener = MapsListener(api, offset_store=store)
+    # starts after the stored offset
+    listener.add_map('map-id', 'map-prefix', Consumer())
+
+    await wait_for(completed, 10)
+    listener.remove_map('map-id')
+    await store.close()
+
+    assert consumed == ['node-id'] * 2
+    assert FileOffsetStore(path).load('map-id') == '2'
+
+
+@pytest.mark.asyncio
+async def test_set_maps():
+    closed = []
+
+    class IdleApi(EventsApi):
+        async def get_map_notify_last(self, map_id: str, kv_prefix: str) -> KvNotifyLast:
+            return KvNotifyLast(value=None, version='0')
+
+        async def get_map_notify(self, map_id: str, kv_prefix: str, offset: Optional[str], limit: int):
+            return []
+
+        async def wait_for_map_notify_last(self, map_id: str, kv_prefix: str, wait_version: str):
+            await asyncio.sleep(3600)
+
+    class Consumer(EventConsumer):
+        def __init__(self, map_id: str):
+            self._map_id = map_id
+
+        async def close(self):
+            await asyncio.sleep(0)
+            if self._map_id == 'failing':
+                raise RuntimeError()
+            closed.append(self._map_id)
+
+    listener = MapsListener(IdleApi())
+    report = await listener.set_maps([MapSpec(m, 'prefix', Consumer(m)) for m in ('a', 'b', 'failing')])
+    assert report == SetMapsReport(added=['a', 'b', 'failing'], removed=[], restarted=[], failed=[], unchanged=0)
+
+    report = await listener.set_maps([
+        MapSpec('a', 'prefix', Consumer('a')),
+        MapSpec('b', 'other-prefix', Consumer('b')),
+        MapSpec('c', 'prefix', Consumer('c')),
+    ], close_concurrency=1)
+    assert report == SetMapsReport(added=['c'], removed=['failing'], restarted=['b'], failed=['failing'], unchanged=1)
+    # removed maps are closed before set_maps returns
+    assert closed == ['b']
+
+    await listener.set_maps([])
+    assert sorted(closed) == ['a', 'b', 'b', 'c']
+
+
+@pytest.mark.asyncio
+async def test_warm_start_with_persisted_notify_version(tmp_path):
+    completed: Future[None] = Future()
+    consumed = []
+
+    class CountingApi(MockEventsApi):
+        notify_last_requests = 0
+
+        async def get_map_notify_last(self, map_id: str, kv_prefix: str) -> KvNotifyLast:
+            self.notify_last_requests += 1
+            return await super().get_map_notify_last(map_id, kv_prefix)
+
+    class Consumer(EventConsumer):
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            # wait_for_map_notify_last of the mock requests notify last too
+            consumed.append(api.notify_last_requests)
+            if len(consumed) == 2:
+                completed.set_result(None)
+
+    event = CompoundMapEvent(
+        type=EventType.node_updated,
+        who=MapEventUser(
+            id='user-id',
+            username='user@test',
+        ),
+        what='node-id',
+    ).dict()
+
+    api = CountingApi(
+        events=[KvEntry(key=[str(i)], value=event) for i in range(3)],
+        map_id='map-id',
+        kv_prefix='map-prefix',
+    )
+    store = FileOffsetStore(str(tmp_path / 'offsets.log'))
+    await store.commit('map-id', '0')
+    store.commit_version('map-id', '3')
+    listener = MapsListener(
+        api,
+        offset_store=store,
+        startup_scheduler=StartupScheduler(rate=10, burst=1),
+        persist_notify_version=True,
+    )
+    listener.add_map('map-id', 'map-prefix', Consumer())
+
+    await wait_for(completed, 10)
+    assert consumed == [0, 0]
+    # let the listener reach the long-poll
+    await asyncio.sleep(0.01)
+
+    api.push_event(KvEntry(key=['3'], value=event))
+    for _ in range(100):
+        if store.load_version('map-id') == '4':
+            break
+        await asyncio.sleep(0.01)
+    assert store.load_version('map-id') == '4'
+    listener.remove_map('map-id')
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_dedupe_entries_consumed_before_crash(tmp_path):
+    blocked: Future[None] = Future()
+    completed: Future[None] = Future()
+    consumed = []
+    commits = []
+
+    class Consumer(EventConsumer):
+        def __init__(self, block: bool):
+            self._block = block
+
+        async def consume(self, timestamp: datetime, event: TypedMapEvent):
+            if self._block and event.what == 'node-2':
+                blocked.set_result(None)
+                # the process crashes here
+                await asyncio.sleep(3600)
+            consumed.append(event.what)
+
+        async def commit(self, offset: str):
+            commits.append(offset)
+            if offset == '3':
+                completed.set_result(None)
+
+    def event(node_id: str):
+        return CompoundMapEvent(
+            type=EventType.node_updated,
+            who=MapEventUser(
+                id='user-id',
+                username='user@test',
+            ),
+            what=node_id,
+        ).dict()
+
+    def api():
+        return MockEventsApi(
+            events=[KvEntry(key=[str(i)], value=event(f'node-{i}')) for i in range(4)],
+            map_id='map-id',
+            kv_prefix='map-prefix',
+        )
+
+    path = str(tmp_path / 'offsets.log')
+    store = FileOffsetStore(path, flush_interval_ms=10)
+    await store.commit('map-id', '0')
+    listener = MapsListener(
+        api(), commit_policy=CommitEveryEvents(1000), offset_store=store, dedupe_window=10, persist_dedupe=True
+    )
+    listener.add_map('map-id', 'map-prefix', Consumer(block=True))
+    await wait_for(blocked, 10)
+    await asyncio.sleep(0.05)
+    # state of the store at the crash, the offset of consumed entry 1 is not committed
+    crashed_path = str(tmp_path / 'crashed.log')
+    shutil.copy(path, crashed_path)
+    assert consumed == ['node-1']
+    assert commits == []
+    await asyncio.wait([listener.remove_map('map-id')])
+    await store.close()
+    crashed = FileOffsetStore(crashed_path)
+    assert crashed.load('map-id') == '0'
+    assert crashed.load_processed('map-id') == ['1']
+
+    consumed.clear()
+    commits.clear()
+    listener = MapsListener(api(), offset_store=crashed, dedupe_window=10, persist_dedupe=True)
+    listener.add_map('map-id', 'map-prefix', Consumer(block=False))
+    await wait_for(completed, 10)
+    listener.remove_map('map-id')
+    await crashed.close()
+
+    # entry 1 is not consumed again, but its offset is committed
+    assert consumed == ['node-2', 'node-3']
+    assert commits == ['1', '2', '3']
+    assert FileOffsetStore(crashed_path).load_processed('map-id') == []
+
+
+def test_commit_policies():
+    assert CommitEachEvent().should_commit(1, 0, False)
+    assert not CommitEachPage().should_commit(5, 1000, False)
+    assert CommitEachPage().should_commit(5, 0, True)
+    assert not CommitEveryEvents(3).should_commit(2, 1000, True)
+    assert CommitEveryEvents(3).should_commit(3, 0, False)
+    assert not CommitEveryInterval(100).should_commit(10, 99, True)
+    assert CommitEveryInterval(100).should_commit(1, 100, False)
+
+
 def test_timeout_error():
     # tests that asyncio.TimeoutError exists
     with pytest.raises(asyncio.TimeoutError):
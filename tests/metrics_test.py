@@ -0,0 +1,82 @@
+import time
+
+from rf_event_listener.metrics import Histogram, MetricsRegistry, RateMeter
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [('0.1', 2), ('1', 3), ('+Inf', 4)]
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 4
+    assert snapshot['sum'] == 5.65
+
+
+def test_rate_meter():
+    meter = RateMeter(window=60)
+    meter.mark(10)
+    meter.mark(20)
+    # less than a second elapsed, so the rate is counted per 1 second
+    assert meter.rate() == 30
+
+
+def test_snapshot_and_lag():
+    registry = MetricsRegistry(buckets=(0.1, 1))
+    first = registry.map('first')
+    first.observe_page(2)
+    first.observe_consume('node_updated', 0.05)
+    first.observe_consume('node_updated', 0.5)
+    first.observe_request('get_map_notify', 0.2)
+    first.observe_commit(str(int((time.time() - 30) * 1000)))
+
+    second = registry.map('second')
+    second.observe_consume('node_deleted', 0.05, events=3)
+    second.observe_commit('1000')
+    second.observe_caught_up(True)
+
+    snapshot = registry.snapshot()
+    assert snapshot['maps']['first']['events'] == 2
+    assert snapshot['maps']['first']['pages'] == 1
+    assert 29 < snapshot['maps']['first']['lag_seconds'] < 60
+    assert snapshot['maps']['second']['lag_seconds'] == 0
+    assert snapshot['total']['events'] == 5
+    assert snapshot['total']['max_lag_seconds'] == snapshot['maps']['first']['lag_seconds']
+    assert snapshot['total']['consume_seconds']['node_updated']['count'] == 2
+    assert snapshot['total']['consume_seconds']['node_deleted']['count'] == 1
+
+    registry.remove_map('second')
+    assert list(registry.snapshot()['maps']) == ['first']
+
+
+def test_lag_grows_after_errors():
+    metrics = MetricsRegistry().map('map')
+    metrics.observe_commit('1000')
+    metrics.observe_caught_up(True)
+    assert metrics.lag() == 0
+
+    # the last successful request was 30 seconds ago
+    metrics.caught_up_timestamp = time.time() - 30
+    metrics.observe_error()
+    # measured from the last request without new events, not from the last event
+    assert 29 < metrics.lag() < 60
+
+
+def test_prometheus_format():
+    registry = MetricsRegistry(buckets=(0.1, 1))
+    metrics = registry.map('map-"1"')
+    metrics.observe_consume('node_updated', 0.5)
+    metrics.observe_request('wait_for_map_notify_last', 2)
+
+    text = registry.prometheus()
+    assert text.endswith('\n')
+    lines = text.splitlines()
+    assert '# TYPE rf_listener_events_total counter' in lines
+    assert 'rf_listener_events_total{map_id="map-\\"1\\""} 1' in lines
+    assert 'rf_listener_consume_seconds_bucket{map_id="map-\\"1\\"",event_type="node_updated",le="0.1"} 0' in lines
+    assert 'rf_listener_consume_seconds_bucket{map_id="map-\\"1\\"",event_type="node_updated",le="+Inf"} 1' in lines
+    assert 'rf_listener_consume_seconds_sum{map_id="map-\\"1\\"",event_type="node_updated"} 0.5' in lines
+    assert 'rf_listener_request_seconds_count{map_id="map-\\"1\\"",request="wait_for_map_notify_last"} 1' in lines
+    # no commit yet, so lag is unknown
+    assert not any(line.startswith('rf_listener_lag_seconds{') for line in lines)
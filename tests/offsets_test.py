@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+import pytest
+
+from rf_event_listener.offsets import FileOffsetStore, SqliteOffsetStore
+
+
+class CountingFileStore(FileOffsetStore):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writes = []
+
+    def _write(self, offsets, versions, processed):
+        self.writes.append(dict(offsets))
+        super()._write(offsets, versions, processed)
+
+
+@pytest.mark.asyncio
+async def test_group_commit_by_events(tmp_path):
+    path = str(tmp_path / 'offsets.log')
+    store = CountingFileStore(path, flush_events=3, flush_interval_ms=60000)
+
+    await store.commit('a', '1')
+    await store.commit('a', '2')
+    assert store.writes == []
+    assert store.load('a') == '2'
+
+    await store.commit('b', '5')
+    # only the latest offset of every map is written
+    assert store.writes == [{'a': '2', 'b': '5'}]
+    await store.close()
+
+    assert FileOffsetStore(path).load('a') == '2'
+
+
+@pytest.mark.asyncio
+async def test_group_commit_by_interval(tmp_path):
+    store = CountingFileStore(str(tmp_path / 'offsets.log'), flush_events=1000, flush_interval_ms=10)
+
+    await store.commit('a', '1')
+    await store.commit('a', '2')
+    await asyncio.sleep(0.05)
+    assert store.writes == [{'a': '2'}]
+
+    await store.commit('a', '3')
+    await store.close()
+    assert store.writes == [{'a': '2'}, {'a': '3'}]
+
+
+@pytest.mark.asyncio
+async def test_file_store_skips_torn_line_and_compacts(tmp_path):
+    path = tmp_path / 'offsets.log'
+    path.write_text('{"map_id": "a", "offset": "1"}\n{"map_id": "b", "offset": "2"}\n{"map_id": "a", "of')
+
+    store = FileOffsetStore(str(path), flush_events=1, compact_lines=5)
+    assert store.load('a') == '1'
+    assert store.load('b') == '2'
+
+    for offset in range(10, 15):
+        await store.commit('a', str(offset))
+    await store.close()
+
+    # compacted to one line per map
+    assert len(path.read_text().splitlines()) <= 4
+    reopened = FileOffsetStore(str(path))
+    assert reopened.load('a') == '14'
+    assert reopened.load('b') == '2'
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store(tmp_path):
+    path = str(tmp_path / 'offsets.sqlite3')
+    store = SqliteOffsetStore(path, flush_events=100)
+    for i in range(250):
+        await store.commit(f'map-{i % 50}', str(i))
+    await store.close()
+
+    reopened = SqliteOffsetStore(path)
+    assert reopened.load('map-0') == '200'
+    assert reopened.load('map-49') == '249'
+    assert reopened.load('unknown') is None
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('store_type', [FileOffsetStore, SqliteOffsetStore])
+async def test_processed_offsets(tmp_path, store_type):
+    path = str(tmp_path / 'offsets')
+    store = store_type(path, flush_events=1000)
+    await store.commit('a', '1')
+    for offset in ('2', '3', '4'):
+        await store.commit_processed('a', offset)
+    await store.flush()
+    assert store.load_processed('a') == ['2', '3', '4']
+
+    # committed offsets are dropped
+    await store.commit('a', '3')
+    await store.commit_processed('a', '5')
+    assert store.load_processed('a') == ['4', '5']
+    await store.close()
+
+    reopened = store_type(path)
+    assert reopened.load_processed('a') == ['4', '5']
+    assert reopened.load_processed('b') == []
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_only_new_processed_offsets_are_written(tmp_path):
+    path = tmp_path / 'offsets.log'
+    store = FileOffsetStore(str(path), flush_events=1000)
+    await store.commit_processed('a', '1')
+    await store.flush()
+    await store.commit_processed('a', '2')
+    await store.close()
+
+    lines = path.read_text().splitlines()
+    assert lines == ['{"map_id": "a", "processed": ["1"]}', '{"map_id": "a", "processed": ["2"]}']
+
+
+class SlowFileStore(FileOffsetStore):
+    def _write(self, offsets, versions, processed):
+        time.sleep(0.05)
+        super()._write(offsets, versions, processed)
+
+
+@pytest.mark.asyncio
+async def test_offsets_being_written_are_loaded(tmp_path):
+    path = str(tmp_path / 'offsets.log')
+    store = SlowFileStore(path, flush_events=1000)
+    await store.commit('a', '1')
+    flush = asyncio.ensure_future(store.flush())
+    await asyncio.sleep(0.01)
+    assert store.load('a') == '1'
+
+    # a cancelled flush still completes its group
+    flush.cancel()
+    await asyncio.wait([flush])
+    assert store.load('a') == '1'
+    await store.close()
+    assert FileOffsetStore(path).load('a') == '1'
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_flush_of_timer(tmp_path):
+    path = str(tmp_path / 'offsets.log')
+    store = SlowFileStore(path, flush_interval_ms=1)
+    await store.commit('a', '1')
+    await asyncio.sleep(0.02)
+    # the timer is writing the group now
+    await store.commit('a', '2')
+    await store.close()
+    assert FileOffsetStore(path).load('a') == '2'
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('store_type', [FileOffsetStore, SqliteOffsetStore])
+async def test_load_committed_by_other_store(tmp_path, store_type):
+    path = str(tmp_path / 'offsets')
+    first = store_type(path, flush_events=1000)
+    second = store_type(path)
+    await first.commit('a', '2')
+    await first.flush()
+
+    assert second.load('a') is None
+    assert await second.load_committed('a') == '2'
+    assert await second.load_committed('b') is None
+    await first.close()
+    await second.close()
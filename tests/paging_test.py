@@ -0,0 +1,35 @@
+from rf_event_listener.paging import AdaptivePageSizer, PageSizer
+
+
+def test_constant_page_size():
+    sizer = PageSizer(100)
+    sizer.observe_fetch(100, 100, 0.1)
+    sizer.observe_consume(100, 100)
+    assert sizer.size == 100
+
+
+def test_grow_on_backlog_and_shrink_when_idle():
+    sizer = AdaptivePageSizer(initial_size=100, min_size=10, max_size=300)
+
+    sizer.observe_fetch(100, 100, 0.1)
+    assert sizer.size == 200
+    sizer.observe_fetch(200, 200, 0.1)
+    assert sizer.size == 300
+
+    sizer.observe_fetch(300, 5, 0.1)
+    assert sizer.size == 150
+    for _ in range(10):
+        sizer.observe_fetch(sizer.size, 0, 0.1)
+    assert sizer.size == 10
+
+
+def test_shrink_on_slow_fetch_or_consume():
+    sizer = AdaptivePageSizer(initial_size=400, max_size=1000, max_fetch_seconds=1, max_consume_seconds=5)
+
+    sizer.observe_fetch(400, 400, 2)
+    assert sizer.size == 200
+
+    sizer.observe_consume(200, 1)
+    assert sizer.size == 200
+    sizer.observe_consume(200, 6)
+    assert sizer.size == 100
@@ -1,10 +1,16 @@
+from concurrent.futures import ProcessPoolExecutor
+
 import pytest
 from pydantic import ValidationError
 
+from rf_event_listener.api import KvEntry
 from rf_event_listener.events import AnyMapEvent, EventType, NodeUpdatedMapEvent, any_event_to_typed, \
     SearchQuerySavedMapEvent, SearchQuerySavedData, NodeCreatedMapEvent, NodeDeletedMapEvent, MapEventUser, \
-    event_type_to_typed_event
+    event_type_to_typed_event, parse_typed_event, NodeTaggedMapEvent, NodeTaggedData, RawEventData, \
+    construct_typed_event, CommandPushedMapEvent, CmdBufferCommandType, \
+    EventVisitor, visited_event_types
 from rf_event_listener.listener import parse_compound_event
+from rf_event_listener.parser import EventParser
 
 
 def test_simple_event():
@@ -193,3 +199,278 @@ def test_event_has_data_field():
     events = parse_compound_event('map', json, False)
 
     assert events[0].data['foo'] == 'bar'
+
+
+def test_single_pass_parsing_matches_any_event_parsing():
+    json = {
+        'type': 'search_query_saved',
+        'what': 'node-id',
+        'who': {
+            'id': 'user-id',
+            'username': 'username',
+        },
+        'sessionId': 'test-session',
+        'data': {
+            'id': 'search-id',
+            'title': 'Foo',
+            'query': 'search query',
+            'timestamp': 123,
+        }
+    }
+
+    expected = any_event_to_typed(AnyMapEvent(**json))
+    actual = parse_typed_event(json)
+
+    assert type(actual) is SearchQuerySavedMapEvent
+    assert expected == actual
+
+
+def test_single_pass_parsing_of_unknown_event():
+    json = {
+        'type': 'unknown_event',
+        'what': 'node-id',
+        'who': {
+            'id': 'user-id',
+            'username': 'username',
+        },
+    }
+
+    with pytest.raises(ValidationError):
+        parse_typed_event(json)
+
+
+def test_parse_compound_event_with_malformed_additional():
+    json = {
+        'type': 'node_updated',
+        'what': 'node-id',
+        'who': {
+            'id': 'user-id',
+            'username': 'username',
+        },
+        'additional': ['not an event'],
+    }
+
+    with pytest.raises(ValidationError):
+        parse_compound_event('map', json, False)
+
+
+def test_lazy_event_data():
+    json = {
+        'type': 'node_tagged',
+        'what': 'node-id',
+        'who': {
+            'id': 'user-id',
+            'username': 'username',
+        },
+        'data': {
+            'node': {
+                'id': 'node-id',
+                'title': 'Node',
+                'map': {
+                    'id': 'map-id',
+                    'name': 'Map',
+                },
+            },
+            'order': 1,
+            'tag_id': 'tag-id',
+        },
+    }
+
+    lazy_event = parse_typed_event(json, lazy_data=True)
+    assert type(lazy_event) is NodeTaggedMapEvent
+    assert type(lazy_event.__dict__['data']) is RawEventData
+
+    assert type(lazy_event.data) is NodeTaggedData
+    assert lazy_event.data.node.map.name == 'Map'
+    assert lazy_event == parse_typed_event(json)
+
+
+def test_lazy_event_data_is_validated_on_access():
+    json = {
+        'type': 'node_tagged',
+        'what': 'node-id',
+        'who': {
+            'id': 'user-id',
+            'username': 'username',
+        },
+        'data': {
+            'order': 'not a number',
+        },
+    }
+
+    lazy_event = parse_typed_event(json, lazy_data=True)
+    assert lazy_event.what == 'node-id'
+
+    with pytest.raises(ValidationError):
+        _ = lazy_event.data
+
+
+def test_construct_trusted_event():
+    json = {
+        'type': 'command_pushed',
+        'what': 'node-id',
+        'who': {
+            'id': 'user-id',
+            'username': 'username',
+        },
+        'sessionId': 'test-session',
+        'data': {
+            'cmd': {
+                'id': 'cmd-id',
+                'type': 'copy',
+                'nodes': ['node-id'],
+                'branch': True,
+                'oneshot': False,
+                'meta': {
+                    'map': {
+                        'id': 'map-id',
+                        'name': 'Map',
+                    },
+                    'titles': ['Node'],
+                },
+            },
+            'position': 0,
+        },
+    }
+
+    event = construct_typed_event(json)
+
+    assert type(event) is CommandPushedMapEvent
+    assert event.type is EventType.command_pushed
+    assert event.session_id == 'test-session'
+    assert event.data.cmd.type is CmdBufferCommandType.copy
+    assert event.data.cmd.meta.map.name == 'Map'
+    assert event == parse_typed_event(json)
+
+
+def test_construct_unknown_event():
+    json = {
+        'type': 'unknown_event',
+        'what': 'node-id',
+        'who': {
+            'id': 'user-id',
+            'username': 'username',
+        },
+    }
+
+    with pytest.raises(ValidationError):
+        construct_typed_event(json)
+
+
+def test_trusted_parser_skips_validation():
+    json = {
+        'type': 'node_updated',
+        'what': 'node-id',
+        'who': {
+            'id': 'user-id',
+            'username': 'username',
+        },
+        'sessionId': 123,
+        'additional': [
+            {
+                'type': 'node_deleted',
+                'what': 'node-id-2',
+            },
+        ],
+    }
+
+    trusted = EventParser(trusted=True).parse_compound_event('map', json)
+    assert [e.type for e in trusted] == [EventType.node_updated, EventType.node_deleted]
+    assert trusted[0].session_id == 123
+    assert trusted[1].who.username == 'username'
+
+
+def test_sampled_validation_reports_schema_drift(caplog):
+    json = {
+        'type': 'node_updated',
+        'what': 'node-id',
+        'who': {
+            'id': 'user-id',
+            'username': 'username',
+        },
+        'sessionId': 123,
+    }
+    parser = EventParser(trusted=True, validation_sample_rate=1.0)
+
+    # the event is returned as if it was not sampled
+    sampled = parser.parse_compound_event('map', json)
+    assert sampled[0].session_id == 123
+    assert 'differs from the validated one' in caplog.text
+
+    caplog.clear()
+    assert parser.parse_compound_event('map', {**json, 'sessionId': '123'})[0].session_id == '123'
+    assert caplog.text == ''
+
+    invalid = {**json, 'sessionId': {'id': 123}}
+    assert parser.parse_compound_event('map', invalid)[0].session_id == {'id': 123}
+    assert 'is not valid' in caplog.text
+
+
+def test_parse_page_in_process_pool():
+    json = {
+        'type': 'node_tagged',
+        'what': 'node-id',
+        'who': {
+            'id': 'user-id',
+            'username': 'username',
+        },
+        'data': {
+            'node': {
+                'id': 'node-id',
+                'title': 'Node',
+                'map': {
+                    'id': 'map-id',
+                    'name': 'Map',
+                },
+            },
+            'order': 1,
+            'tag_id': 'tag-id',
+        },
+    }
+    entries = [KvEntry(key=['1000'], value=json), KvEntry(key=['2000'], value=json)]
+    parser = EventParser(lazy_data=True)
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        parsed = executor.submit(parser.parse_page, 'map', entries).result()
+
+    assert [offset for offset, _ in parsed] == ['1000', '2000']
+    assert parsed == parser.parse_page('map', entries)
+    assert parsed[1][1][0][1].data.node.map.name == 'Map'
+
+
+def test_event_type_filter():
+    who = {'id': 'user-id', 'username': 'username'}
+    json = {
+        'type': 'node_updated',
+        'what': 'node-id',
+        'who': who,
+        'additional': [
+            {'type': 'node_created', 'what': 'node-id-2'},
+            {'type': 'unknown_type', 'what': 'node-id-3'},
+            {'type': 'node_deleted', 'what': 'node-id-4'},
+        ],
+    }
+
+    for trusted in (False, True):
+        parser = EventParser(trusted=trusted, event_types={EventType.node_created, EventType.node_deleted})
+        events = parser.parse_compound_event('map', json)
+        assert [e.what for e in events] == ['node-id-2', 'node-id-4']
+        assert events[0].who == MapEventUser(**who)
+
+    parser = EventParser(event_types={EventType.node_moved})
+    assert parser.parse_compound_event('map', json) == []
+    # filtered events are not validated
+    assert parser.parse_compound_event('map', {'type': 'node_updated'}) == []
+    assert parser.parse_entry('map', KvEntry(key=['1000'], value=json)) == []
+
+
+def test_visited_event_types():
+    class Visitor(EventVisitor):
+        async def node_created(self, event):
+            return True
+
+        async def command_pushed(self, event):
+            return True
+
+    assert visited_event_types(Visitor(False)) == {EventType.node_created, EventType.command_pushed}
+    assert visited_event_types(EventVisitor(None)) == set()
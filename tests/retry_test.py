@@ -0,0 +1,91 @@
+import aiohttp
+import asyncio
+import pytest
+from typing import Optional
+
+from rf_event_listener.retry import ExponentialBackoff, CircuitBreaker
+
+
+def test_exponential_backoff():
+    backoff = ExponentialBackoff(initial_delay=0.5, max_delay=4, multiplier=2, jitter=0)
+    assert [backoff.delay(attempt) for attempt in range(1, 6)] == [0.5, 1, 2, 4, 4]
+    # long outages do not overflow
+    assert backoff.delay(5000) == 4
+
+
+def test_backoff_jitter():
+    backoff = ExponentialBackoff(initial_delay=1, max_delay=10, jitter=0.5)
+    delays = [backoff.delay(3) for _ in range(100)]
+    assert all(2 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+async def fail(breaker: CircuitBreaker, error: Optional[Exception] = None):
+    error = error or aiohttp.ClientConnectionError()
+    with pytest.raises(type(error)):
+        async with breaker.guard():
+            raise error
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_after_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+
+    await fail(breaker)
+    assert not breaker.is_open
+    await fail(breaker)
+    assert breaker.is_open
+
+    calls = []
+
+    async def call(name: str):
+        async with breaker.guard():
+            calls.append(f'{name} started')
+            await asyncio.sleep(0.01)
+            calls.append(f'{name} finished')
+
+    # both calls wait for the reset timeout, then one of them probes and closes the breaker
+    await asyncio.wait_for(asyncio.gather(call('first'), call('second')), 10)
+    assert calls in [
+        ['first started', 'first finished', 'second started', 'second finished'],
+        ['second started', 'second finished', 'first started', 'first finished'],
+    ]
+    assert not breaker.is_open
+
+
+@pytest.mark.asyncio
+async def test_failed_probe_opens_circuit_breaker_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+
+    await fail(breaker)
+    await fail(breaker)
+    assert breaker.is_open
+
+    async with breaker.guard():
+        pass
+    assert not breaker.is_open
+
+
+@pytest.mark.asyncio
+async def test_success_resets_failures():
+    breaker = CircuitBreaker(failure_threshold=2)
+
+    await fail(breaker)
+    async with breaker.guard():
+        pass
+    await fail(breaker)
+
+    assert not breaker.is_open
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_open_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=1)
+
+    forbidden = aiohttp.ClientResponseError(None, (), status=403)
+    await fail(breaker, forbidden)
+    await fail(breaker, RuntimeError())
+    assert not breaker.is_open
+
+    await fail(breaker, aiohttp.ClientResponseError(None, (), status=503))
+    assert breaker.is_open
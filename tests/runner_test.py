@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from functools import partial
+from typing import Optional, List
+
+import pytest
+
+from rf_event_listener.api import EventsApi, KvNotifyLast, KvEntry
+from rf_event_listener.events import TypedMapEvent
+from rf_event_listener.listener import MapsListener, EventConsumer
+from rf_event_listener.runner import MultiProcessRunner
+
+
+class MapEventsApi(EventsApi):
+    """ Every map has two events """
+
+    async def get_map_notify_last(self, map_id: str, kv_prefix: str) -> KvNotifyLast:
+        return KvNotifyLast(value=None, version='0')
+
+    async def get_map_notify(self, map_id: str, kv_prefix: str, offset: Optional[str], limit: int) -> List[KvEntry]:
+        events = [
+            KvEntry(key=[str(i)], value={'type': 'node_updated', 'what': map_id, 'who': {'id': 'u', 'username': 'u'}})
+            for i in range(1000, 1002)
+        ]
+        return [e for e in events if e.key[-1] > (offset or '')][:limit]
+
+    async def wait_for_map_notify_last(self, map_id: str, kv_prefix: str, wait_version: str) -> Optional[KvNotifyLast]:
+        await asyncio.sleep(3600)
+
+
+class FileConsumer(EventConsumer):
+    def __init__(self, path: str):
+        self._path = path
+
+    async def consume(self, timestamp: datetime, event: TypedMapEvent):
+        with open(self._path, 'a') as f:
+            f.write(f'{os.getpid()} {event.what}\n')
+
+
+def create_listener() -> MapsListener:
+    return MapsListener(MapEventsApi())
+
+
+def create_consumer(directory: str, map_id: str) -> EventConsumer:
+    return FileConsumer(os.path.join(directory, map_id))
+
+
+def wait_for_files(directory: str, count: int):
+    for _ in range(500):
+        files = [os.path.join(directory, name) for name in os.listdir(directory)]
+        if len(files) == count and all(len(open(f).readlines()) == 2 for f in files):
+            return
+        time.sleep(0.02)
+    raise TimeoutError()
+
+
+def test_maps_run_in_worker_processes(tmp_path):
+    directory = str(tmp_path)
+    runner = MultiProcessRunner(partial(create_consumer, directory), workers=2, listener_factory=create_listener)
+    maps = [f'map-{i}' for i in range(6)]
+    # maps added before start are started with the workers
+    runner.add_map(maps[0], 'prefix', initial_offset='0999')
+    with pytest.raises(RuntimeError):
+        runner.health()
+    runner.start()
+    try:
+        # restarted workers do not rewind the map to its initial offset
+        assert runner._maps[maps[0]] == ('prefix', None)
+        for map_id in maps[1:]:
+            runner.add_map(map_id, 'prefix')
+        assert {runner.worker_of(m) for m in maps} == {0, 1}
+
+        wait_for_files(directory, len(maps))
+        pids = set()
+        for map_id in maps:
+            lines = open(os.path.join(directory, map_id)).read().split()
+            assert lines[1::2] == [map_id, map_id]
+            pids.add(lines[0])
+        assert len(pids) == 2
+        assert os.getpid() not in {int(pid) for pid in pids}
+
+        runner.remove_map('map-0')
+        health = runner.health()
+        assert health['healthy']
+        assert health['maps'] == 5
+        assert sum(w['maps_running'] for w in health['workers']) == 5
+
+        runner._workers[0].process.kill()
+        runner._workers[0].process.join()
+        assert not runner.health(timeout=1)['healthy']
+        assert runner.restart_dead_workers() == [0]
+        assert runner.health()['healthy']
+        assert sum(w['maps_running'] for w in runner.health()['workers']) == 5
+    finally:
+        runner.stop()
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from asyncio import Future
+
+from rf_event_listener.scheduler import LongPollScheduler
+
+
+@pytest.mark.asyncio
+async def test_limits_concurrent_waits():
+    scheduler = LongPollScheduler(max_concurrent_waits=2, slice_timeout=10)
+    running = 0
+    max_running = 0
+
+    async def poll():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return 'version'
+
+    results = await asyncio.gather(*[scheduler.wait(poll) for _ in range(5)])
+
+    assert results == ['version'] * 5
+    assert max_running == 2
+
+    stats = scheduler.stats()
+    assert stats['active_waits'] == 0
+    assert stats['queued_waits'] == 0
+    assert stats['total_waits'] == 5
+    assert stats['queue_delay_max'] > 0
+
+
+@pytest.mark.asyncio
+async def test_preempts_long_wait_for_queued_one():
+    scheduler = LongPollScheduler(max_concurrent_waits=1, slice_timeout=0.01)
+    never: Future[str] = Future()
+
+    first = asyncio.ensure_future(scheduler.wait(lambda: never))
+    await asyncio.sleep(0.02)
+    # nobody is queued, so the first long-poll keeps its slot
+    assert not first.done()
+
+    async def poll():
+        return 'version'
+
+    second = await asyncio.wait_for(scheduler.wait(poll), 10)
+
+    assert await first is None
+    assert second == 'version'
+    assert never.cancelled()
+    assert scheduler.stats()['preempted_waits'] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancel_queued_wait():
+    scheduler = LongPollScheduler(max_concurrent_waits=1)
+    release: Future[str] = Future()
+
+    first = asyncio.ensure_future(scheduler.wait(lambda: release))
+    second = asyncio.ensure_future(scheduler.wait(lambda: release))
+    await asyncio.sleep(0)
+
+    second.cancel()
+    release.set_result('version')
+
+    assert await first == 'version'
+    assert scheduler.stats()['active_waits'] == 0
+    assert scheduler.stats()['queued_waits'] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_queued_wait_with_released_slot():
+    scheduler = LongPollScheduler(max_concurrent_waits=1)
+    never: Future[str] = Future()
+
+    first = asyncio.ensure_future(scheduler.wait(lambda: never))
+    second = asyncio.ensure_future(scheduler.wait(lambda: never))
+    await asyncio.sleep(0)
+
+    # the first releases its slot to the second, which is already cancelled
+    first.cancel()
+    second.cancel()
+    await asyncio.wait([first, second])
+
+    assert second.cancelled()
+    assert scheduler.stats()['active_waits'] == 0
+    assert scheduler.stats()['queued_waits'] == 0
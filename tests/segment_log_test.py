@@ -0,0 +1,105 @@
+from typing import Optional, List
+
+import pytest
+
+from rf_event_listener.api import EventsApi, KvEntry
+from rf_event_listener.segment_log import SegmentLog, ReplayEventsApi
+
+
+def entry(offset: int) -> KvEntry:
+    return KvEntry(key=['mapNotif', str(offset)], value={'type': 'node_updated', 'what': f'node-{offset}'})
+
+
+class CountingApi(EventsApi):
+    def __init__(self, entries: List[KvEntry]):
+        self._entries = entries
+        self.requests = []
+
+    async def get_map_notify(self, map_id: str, kv_prefix: str, offset: Optional[str], limit: int) -> List[KvEntry]:
+        self.requests.append(offset)
+        return [e for e in self._entries if e.key[-1] > (offset or '')][:limit]
+
+
+def test_append_and_read_across_segments(tmp_path):
+    log = SegmentLog(str(tmp_path), segment_bytes=200)
+    map_log = log.map_log('map', 'prefix')
+    assert not map_log.covers(None)
+
+    entries = [entry(1000 + i) for i in range(10)]
+    map_log.append(None, entries[:6])
+    map_log.append('1005', entries[6:])
+    assert len(list((tmp_path / 'map%3Aprefix').glob('*.log'))) > 1
+
+    assert map_log.covers(None)
+    assert map_log.covers('1004')
+    assert not map_log.covers('1009')
+    assert map_log.read(None, 100) == entries
+    page = map_log.read('1003', 4)
+    assert page == entries[4:8]
+    assert page.raw_size > 0
+
+    # not contiguous with the last entry, so it is ignored
+    map_log.append('2000', [entry(2001)])
+    assert map_log.last == '1009'
+    log.close()
+
+    reopened = SegmentLog(str(tmp_path)).map_log('map', 'prefix')
+    assert reopened.start == ''
+    assert reopened.read('1007', 100) == entries[8:]
+
+
+def test_torn_line_is_truncated(tmp_path):
+    log = SegmentLog(str(tmp_path))
+    map_log = log.map_log('map', 'prefix')
+    map_log.append(None, [entry(1000), entry(1001)])
+    log.close()
+
+    segment = next((tmp_path / 'map%3Aprefix').glob('*.log'))
+    with open(str(segment), 'ab') as f:
+        f.write(b'1002\t{"key": ["mapNo')
+
+    map_log = SegmentLog(str(tmp_path)).map_log('map', 'prefix')
+    assert map_log.last == '1001'
+    map_log.append('1001', [entry(1002)])
+    assert map_log.read(None, 10) == [entry(1000), entry(1001), entry(1002)]
+
+
+def test_retention_moves_start(tmp_path):
+    map_log = SegmentLog(str(tmp_path), segment_bytes=1, max_segments=2).map_log('map', 'prefix')
+    map_log.append(None, [entry(1000 + i) for i in range(5)])
+
+    # one entry per segment, the first three are deleted
+    assert map_log.start == '1002'
+    assert not map_log.covers(None)
+    assert map_log.read('1002', 10) == [entry(1003), entry(1004)]
+
+
+@pytest.mark.asyncio
+async def test_replay_from_log(tmp_path):
+    entries = [entry(1000 + i) for i in range(5)]
+    api = CountingApi(entries)
+    replay = ReplayEventsApi(api, SegmentLog(str(tmp_path)))
+
+    assert await replay.get_map_notify('map', 'prefix', None, 3) == entries[:3]
+    assert await replay.get_map_notify('map', 'prefix', '1002', 3) == entries[3:]
+    assert api.requests == [None, '1002']
+
+    # replay from the beginning is served by the log, the rest of the page by the api
+    assert await replay.get_map_notify('map', 'prefix', None, 10) == entries
+    assert api.requests == [None, '1002', '1004']
+    assert await replay.get_map_notify('map', 'prefix', '1004', 10) == []
+    assert api.requests == [None, '1002', '1004', '1004']
+
+
+@pytest.mark.asyncio
+async def test_replay_fills_page_at_end_of_log(tmp_path):
+    entries = [entry(1000 + i) for i in range(10)]
+    api = CountingApi(entries)
+    log = SegmentLog(str(tmp_path))
+    log.map_log('map', 'prefix').append(None, entries[:3])
+    replay = ReplayEventsApi(api, log)
+
+    # a full page, so the listener does not wait for new events
+    assert await replay.get_map_notify('map', 'prefix', None, 5) == entries[:5]
+    assert api.requests == ['1002']
+    assert log.map_log('map', 'prefix').last == '1004'
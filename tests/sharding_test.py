@@ -0,0 +1,143 @@
+import asyncio
+from collections import Counter
+from typing import Optional, List, Tuple
+
+import pytest
+
+from rf_event_listener.api import EventsApi, KvNotifyLast, KvEntry
+from rf_event_listener.listener import MapsListener, EventConsumer
+from rf_event_listener.offsets import SqliteOffsetStore
+from rf_event_listener.sharding import HashRing, SqliteLeaseBackend, ShardedMapsListener
+
+
+class IdleApi(EventsApi):
+    async def get_map_notify_last(self, map_id: str, kv_prefix: str) -> KvNotifyLast:
+        return KvNotifyLast(value=None, version='0')
+
+    async def get_map_notify(self, map_id: str, kv_prefix: str, offset: Optional[str], limit: int) -> List[KvEntry]:
+        return []
+
+    async def wait_for_map_notify_last(self, map_id: str, kv_prefix: str, wait_version: str) -> Optional[KvNotifyLast]:
+        await asyncio.sleep(3600)
+
+
+def test_hash_ring_moves_few_maps():
+    maps = [f'map-{i}' for i in range(1000)]
+    ring = HashRing(['a', 'b', 'c'])
+    owners = {m: ring.owner(m) for m in maps}
+    assert all(count > 200 for count in Counter(owners.values()).values())
+
+    grown = HashRing(['a', 'b', 'c', 'd'])
+    moved = [m for m in maps if grown.owner(m) != owners[m]]
+    # only maps of the new node move
+    assert all(grown.owner(m) == 'd' for m in moved)
+    assert len(moved) < 400
+
+    assert HashRing([]).owner('map') is None
+
+
+@pytest.mark.asyncio
+async def test_sqlite_leases(tmp_path):
+    backend = SqliteLeaseBackend(str(tmp_path / 'leases.sqlite3'))
+    assert await backend.acquire('map', 'a', 30)
+    assert not await backend.acquire('map', 'b', 30)
+    assert await backend.acquire('map', 'a', 30)
+
+    await backend.release('map', 'a')
+    assert await backend.acquire('map', 'b', 30)
+
+    # expired lease is taken over
+    assert await backend.acquire('other', 'a', -1)
+    assert await backend.acquire('other', 'b', 30)
+
+    await backend.heartbeat('a', 30)
+    await backend.heartbeat('b', -1)
+    assert await backend.live_nodes() == ['a']
+    await backend.leave('a')
+    assert await backend.live_nodes() == []
+    backend.close()
+
+
+@pytest.mark.asyncio
+async def test_maps_are_rebalanced_without_duplicates(tmp_path):
+    path = str(tmp_path / 'leases.sqlite3')
+    maps = [f'map-{i}' for i in range(20)]
+
+    def node(node_id: str) -> ShardedMapsListener:
+        sharded = ShardedMapsListener(MapsListener(IdleApi()), SqliteLeaseBackend(path), node_id)
+        for map_id in maps:
+            sharded.add_map(map_id, 'prefix', EventConsumer())
+        return sharded
+
+    a = node('a')
+    await a.rebalance()
+    assert a.owned_maps == set(maps)
+
+    b = node('b')
+    await b.rebalance()
+    # maps of b are still leased by a
+    assert b.owned_maps == set()
+
+    await a.rebalance()
+    await b.rebalance()
+    assert a.owned_maps.isdisjoint(b.owned_maps)
+    assert a.owned_maps | b.owned_maps == set(maps)
+    assert len(b.owned_maps) > 0
+
+    await b.stop()
+    await a.rebalance()
+    assert a.owned_maps == set(maps)
+    await a.stop()
+
+
+@pytest.mark.asyncio
+async def test_map_is_stopped_when_lease_is_taken_over(tmp_path):
+    backend = SqliteLeaseBackend(str(tmp_path / 'leases.sqlite3'))
+    a = ShardedMapsListener(MapsListener(IdleApi()), backend, 'a')
+    a.add_map('map', 'prefix', EventConsumer())
+    await a.rebalance()
+    assert a.owned_maps == {'map'}
+
+    # the lease of a expired and b took it over
+    await backend.release('map', 'a')
+    assert await backend.acquire('map', 'b', 30)
+    await a.rebalance()
+    assert a.owned_maps == set()
+    # the lease of b is kept
+    assert not await backend.acquire('map', 'a', 30)
+    await a.stop()
+
+
+@pytest.mark.asyncio
+async def test_taken_over_map_continues_from_committed_offset(tmp_path):
+    added = []
+
+    class RecordingListener(MapsListener):
+        def add_map(self, map_id: str, kv_prefix: str, consumer: EventConsumer, initial_offset=None, **kwargs):
+            added.append(initial_offset)
+            super().add_map(map_id, kv_prefix, consumer, initial_offset, **kwargs)
+
+    offsets_path = str(tmp_path / 'offsets.sqlite3')
+    leases_path = str(tmp_path / 'leases.sqlite3')
+
+    def node(node_id: str) -> Tuple[ShardedMapsListener, SqliteOffsetStore]:
+        store = SqliteOffsetStore(offsets_path, flush_interval_ms=60000)
+        listener = RecordingListener(IdleApi(), offset_store=store)
+        sharded = ShardedMapsListener(listener, SqliteLeaseBackend(leases_path), node_id)
+        sharded.add_map('map', 'prefix', EventConsumer(), initial_offset='1000')
+        return sharded, store
+
+    a, a_store = node('a')
+    b, b_store = node('b')
+    await a.rebalance()
+    assert a.owned_maps == {'map'}
+    # committed, but not flushed yet
+    await a_store.commit('map', '2000')
+
+    await a.stop()
+    await b.rebalance()
+    assert b.owned_maps == {'map'}
+    assert added == ['1000', '2000']
+    await b.stop()
+    await a_store.close()
+    await b_store.close()
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Optional
+
+import pytest
+
+from rf_event_listener.startup import StartupScheduler
+
+
+@pytest.mark.asyncio
+async def test_ramp_in_priority_order():
+    scheduler = StartupScheduler(rate=100, burst=2)
+    started = []
+
+    async def start(map_id: str, offset: str):
+        await scheduler.admit(map_id, offset)
+        started.append(map_id)
+
+    tasks = [asyncio.ensure_future(start(f'map-{i}', str(1010 - i))) for i in range(6)]
+    await asyncio.sleep(0.001)
+    # burst of the oldest offsets
+    assert started == ['map-5', 'map-4']
+    assert scheduler.waiting == 4
+
+    await asyncio.wait_for(asyncio.gather(*tasks), 1)
+    assert started == [f'map-{i}' for i in range(5, -1, -1)]
+
+
+@pytest.mark.asyncio
+async def test_maps_without_offset_start_last():
+    scheduler = StartupScheduler(rate=1000, burst=1)
+    await scheduler.admit('first', None)
+    started = []
+
+    async def start(map_id: str, offset: Optional[str]):
+        await scheduler.admit(map_id, offset)
+        started.append(map_id)
+
+    await asyncio.wait_for(asyncio.gather(start('new', None), start('old', '1000')), 1)
+    assert started == ['old', 'new']
+
+
+@pytest.mark.asyncio
+async def test_cancelled_map_does_not_take_slot():
+    scheduler = StartupScheduler(rate=20, burst=1)
+    await scheduler.admit('first', '1')
+
+    cancelled = asyncio.ensure_future(scheduler.admit('cancelled', '2'))
+    waiting = asyncio.ensure_future(scheduler.admit('waiting', '3'))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+
+    await asyncio.wait_for(waiting, 2)
+    assert cancelled.cancelled()
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from rf_event_listener.streaming import JsonArraySplitter
+
+ITEMS = [
+    {'key': ['mapNotif', '0'], 'value': {'title': 'brackets ]}[{, and "quotes" \\ in strings'}},
+    {'key': ['mapNotif', '1'], 'value': {'nested': [1, [2, {'a': None}]], 'unicode': 'ключ'}},
+    42,
+    'string',
+    [],
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1000])
+def test_split_chunked_array(chunk_size: int):
+    raw = json.dumps(ITEMS, ensure_ascii=False).encode()
+    splitter = JsonArraySplitter()
+
+    items = []
+    for i in range(0, len(raw), chunk_size):
+        items.extend(splitter.feed(raw[i:i + chunk_size]))
+    splitter.close()
+
+    assert [json.loads(item) for item in items] == ITEMS
+
+
+def test_split_empty_array():
+    splitter = JsonArraySplitter()
+    assert splitter.feed(b' [ ] ') == []
+    splitter.close()
+
+
+def test_buffer_holds_only_unfinished_item():
+    splitter = JsonArraySplitter()
+    assert splitter.feed(b'[{"a": 1}, {"b":') == [b'{"a": 1}']
+    assert bytes(splitter._buffer) == b' {"b":'
+    assert splitter.feed(b' 2}]') == [b'{"b": 2}']
+
+
+@pytest.mark.parametrize('raw', [b'{}', b'[1,,2]', b'[1, 2', b'[1] 2'])
+def test_malformed_array(raw: bytes):
+    with pytest.raises(ValueError):
+        splitter = JsonArraySplitter()
+        splitter.feed(raw)
+        splitter.close()
@@ -0,0 +1,63 @@
+import pytest
+
+from rf_event_listener.tracing import Tracer, TraceHook, TraceStage
+
+
+class RecordingHook(TraceHook):
+    def __init__(self):
+        self.calls = []
+
+    def on_start(self, stage, map_id, offset):
+        self.calls.append(('start', stage, map_id, offset))
+        return len(self.calls)
+
+    def on_end(self, stage, map_id, offset, seconds, context, error):
+        assert seconds >= 0
+        self.calls.append(('end', stage, map_id, offset, context, error))
+
+
+def test_no_hooks_share_span():
+    tracer = Tracer()
+    assert tracer.span(TraceStage.parse, 'map') is tracer.span(TraceStage.commit, 'other', '1')
+
+
+def test_span_calls_hooks():
+    hook = RecordingHook()
+    tracer = Tracer([hook])
+
+    with tracer.span(TraceStage.commit, 'map', '1'):
+        pass
+
+    error = ValueError()
+    with pytest.raises(ValueError):
+        with tracer.span(TraceStage.consume, 'map', '2'):
+            raise error
+
+    assert hook.calls == [
+        ('start', TraceStage.commit, 'map', '1'),
+        ('end', TraceStage.commit, 'map', '1', 1, None),
+        ('start', TraceStage.consume, 'map', '2'),
+        ('end', TraceStage.consume, 'map', '2', 3, error),
+    ]
+
+    tracer.remove_hook(hook)
+    with tracer.span(TraceStage.commit, 'map', '3'):
+        pass
+    assert len(hook.calls) == 4
+
+
+def test_failing_hook_does_not_break_stage():
+    class FailingHook(TraceHook):
+        def on_start(self, stage, map_id, offset):
+            raise RuntimeError()
+
+        def on_end(self, stage, map_id, offset, seconds, context, error):
+            raise RuntimeError()
+
+    hook = RecordingHook()
+    tracer = Tracer([FailingHook()])
+    tracer.add_hook(hook)
+
+    with tracer.span(TraceStage.parse, 'map', '1'):
+        pass
+    assert [call[0] for call in hook.calls] == ['start', 'end']